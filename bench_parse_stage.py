@@ -0,0 +1,108 @@
+"""Сравнение разбора страниц Nitter в потоках и в пуле процессов (ParseStage).
+
+Запуск: python bench_parse_stage.py [--pages 200] [--items 20] [--workers 4]
+
+Для каждого уровня конкурентности печатает пропускную способность (страниц/сек)
+разбора в текущем процессе и через пул процессов. При малой конкурентности
+выигрывает разбор на месте (нет затрат на IPC), при большой - пул процессов,
+так как разбор BeautifulSoup упирается в GIL.
+"""
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scrapper_bot import ParseStage, parse_nitter_timeline
+
+# Импорт бота подключает вывод лога в bot.log и консоль, а разбор каждой страницы пишет
+# в лог: это засоряет таблицу и искажает замеры. Код модуля выполняется и в процессах пула,
+# запущенных через spawn, поэтому лог отключается и там
+root_logger = logging.getLogger()
+for handler in list(root_logger.handlers):
+    root_logger.removeHandler(handler)
+    handler.close()
+root_logger.setLevel(logging.WARNING)
+
+TWEET_TEMPLATE = """
+<div class="timeline-item ">
+  <a class="tweet-link" href="/bench/status/{tweet_id}#m"></a>
+  <div class="tweet-body">
+    <div class="tweet-header">
+      <a class="fullname" href="/bench">Bench</a>
+      <span class="tweet-date"><a href="/bench/status/{tweet_id}#m" title="Mar 28, 2025 · 10:{minute:02d} PM UTC">Mar 28</a></span>
+    </div>
+    <div class="tweet-content media-body" dir="auto">{text}</div>
+    <div class="attachments"><div class="gallery-row"><div class="attachment image">
+      <a class="still-image" href="/pic/orig/media%2F{tweet_id}.jpg"><img src="/pic/media%2F{tweet_id}.jpg" alt=""></a>
+    </div></div></div>
+    <div class="tweet-stats">
+      <span class="tweet-stat"><div class="icon-container"><span class="icon-comment"></span> 12</div></span>
+      <span class="tweet-stat"><div class="icon-container retweet"><span class="icon-retweet"></span> 34</div></span>
+      <span class="tweet-stat"><div class="icon-container heart"><span class="icon-heart"></span> 567</div></span>
+    </div>
+  </div>
+</div>
+"""
+
+
+def build_page(items):
+    """Синтетическая страница профиля Nitter с items твитами"""
+    tweets = "".join(
+        TWEET_TEMPLATE.format(
+            tweet_id=1900000000000000000 - i,
+            minute=59 - (i % 60),
+            text="Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4
+        )
+        for i in range(items)
+    )
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Bench</title></head>"
+        "<body><div class=\"container\"><div class=\"timeline-container\"><div class=\"timeline\">"
+        f"{tweets}</div></div></div></body></html>"
+    ).encode("utf-8")
+
+
+def run_inline(page, pages, concurrency):
+    """Разбор в потоках текущего процесса"""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: parse_nitter_timeline(page, "bench"), range(pages)))
+        return pages / (time.perf_counter() - start)
+
+
+def run_stage(stage, page, pages, concurrency):
+    """Разбор через пул процессов; concurrency потоков ждут результаты, как проверки аккаунтов"""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: stage.submit(page, "bench").result(), range(pages)))
+        return pages / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200, help="страниц на замер")
+    parser.add_argument("--items", type=int, default=20, help="твитов на странице")
+    parser.add_argument("--workers", type=int, default=4, help="процессов в пуле разбора")
+    parser.add_argument("--batch-size", type=int, default=8, help="страниц в одной пачке")
+    args = parser.parse_args()
+
+    page = build_page(args.items)
+    print(f"Страница: {len(page) / 1024:.0f} КБ, {args.items} твитов; "
+          f"пул: {args.workers} процессов, пачка до {args.batch_size}")
+
+    stage = ParseStage(workers=args.workers, batch_size=args.batch_size, batch_delay=0.005)
+    try:
+        # Прогрев процессов пула
+        stage.submit(page, "bench").result()
+
+        print(f"{'потоков':>8} {'на месте, стр/с':>16} {'пул, стр/с':>12} {'ускорение':>10}")
+        for concurrency in (1, 2, 4, 8, 16, 32):
+            inline_rate = run_inline(page, args.pages, concurrency)
+            stage_rate = run_stage(stage, page, args.pages, concurrency)
+            print(f"{concurrency:>8} {inline_rate:>16.1f} {stage_rate:>12.1f} {stage_rate / inline_rate:>9.2f}x")
+    finally:
+        stage.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,13 +16,56 @@ from urllib.parse import quote
 import aiohttp
 import traceback
 import asyncio
+import threading
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 import apify
 
 
+# Состояние страницы профиля: твиты отрисованы, стена логина или профиль недоступен.
+# Возвращает null, пока страница еще загружается.
+PAGE_STATE_SCRIPT = r"""
+    if (document.querySelector('article[data-testid="tweet"]')) return 'tweets';
+    if (/^\/(i\/flow\/)?login/.test(location.pathname)) return 'login_wall';
+
+    const empty = document.querySelector('[data-testid="emptyState"]');
+    const text = empty ? empty.innerText : (document.body ? document.body.innerText : '');
+    if (/Account suspended|аккаунт заблокирован/i.test(text)) return 'suspended';
+    if (/account doesn.t exist|аккаунт не существует/i.test(text)) return 'not_found';
+    if (/(posts|Tweets) are protected|твиты защищены|посты защищены/i.test(text)) return 'protected';
+
+    if (document.querySelector('[data-testid="loginButton"], [data-testid="login"]') &&
+        document.querySelector('[data-testid="sheetDialog"], [role="dialog"]')) return 'login_wall';
+    return null;
+"""
+
+# Путь к chromedriver определяется один раз при запуске бота
+chromedriver_path = None
+
+
+def resolve_chromedriver():
+    """Возвращает путь к chromedriver: явно заданный или найденный ChromeDriverManager"""
+    global chromedriver_path
+    if chromedriver_path:
+        return chromedriver_path
+
+    # Явно указанный локальный chromedriver позволяет работать без сети
+    configured = os.getenv("CHROMEDRIVER_PATH") or get_settings().get("chromedriver_path")
+    if configured:
+        if not os.path.isfile(configured):
+            raise FileNotFoundError(f"chromedriver не найден: {configured}")
+        chromedriver_path = configured
+    else:
+        chromedriver_path = ChromeDriverManager().install()
+
+    logger.info(f"Используется chromedriver: {chromedriver_path}")
+    return chromedriver_path
+
+
 class HTMLSession:
     def __init__(self):
         options = Options()
@@ -30,13 +73,22 @@ class HTMLSession:
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-dev-shm-usage")
         self.driver = webdriver.Chrome(
-            service=Service(ChromeDriverManager().install()),
+            service=Service(resolve_chromedriver()),
             options=options
         )
+        self.page_state = None
 
     def get(self, url, proxies=None, timeout=30):
         self.driver.get(url)
-        time.sleep(3)  # Даем время для загрузки JS
+
+        # Ждем появления твитов или признаков недоступного профиля вместо фиксированной паузы
+        ready_timeout = min(timeout, get_settings().get("web_ready_timeout", 10))
+        try:
+            self.page_state = WebDriverWait(self.driver, ready_timeout, poll_frequency=0.25).until(
+                lambda driver: driver.execute_script(PAGE_STATE_SCRIPT)
+            )
+        except TimeoutException:
+            self.page_state = "timeout"
         return self
 
     @property
@@ -125,7 +177,17 @@ def get_settings():
         "min_interval_factor": 0.8,
         "max_interval_factor": 1.2,
         "parallel_checks": 3,
-        "nitter_instances": NITTER_INSTANCES
+        "nitter_instances": NITTER_INSTANCES,
+        "chromedriver_path": "",
+        "web_ready_timeout": 10,
+        "race_methods": False,
+        "race_stagger": {"nitter": 0, "apify": 0.5, "web": 1.5},
+        "negative_cache": True,
+        "negative_after_failures": 5,
+        "negative_base_backoff": 1800,
+        "negative_max_backoff": 86400,
+        "negative_probe_methods": ["nitter"],
+        "negative_widen_after": 3
     })
 
 
@@ -406,6 +468,10 @@ class TwitterClient:
 
 
 # Скраперы для получения твитов
+# Итоги гонки методов: запуски, победы, проигрыши, отмены и суммарное время работы
+race_stats = {}
+
+
 class TwitterScrapers:
     def __init__(self):
         self.user_agents = [
@@ -493,20 +559,34 @@ class TwitterScrapers:
 
         return None, None
 
-    def get_latest_tweet_web(self, username, use_proxies=False):
-        """Улучшенный веб-парсинг с requests-html"""
+    def get_latest_tweet_web(self, username, use_proxies=False, cancel=None):
+        """Улучшенный веб-парсинг с requests-html; cancel прерывает проверку перед загрузкой
+        страницы, перед запуском браузера для рендеринга и после него"""
         cache_key = self.get_cache_key("web", username)
         cached = self.get_cached_data(cache_key)
         if cached:
             return cached
 
+        def cancelled():
+            if cancel is not None and cancel.is_set():
+                logger.info(f"Проверка @{username} через веб-парсинг отменена")
+                return True
+            return False
+
         try:
+            if cancelled():
+                return None, None
             session = HTMLSession()
             url = f"https://twitter.com/{username}"
             proxies = get_random_proxy() if use_proxies else None
 
             response = session.get(url, proxies=proxies, timeout=30)
+            # Рендеринг - самая дорогая часть: запускает браузер и ждет скрипты страницы
+            if cancelled():
+                return None, None
             response.html.render(timeout=20, sleep=3)
+            if cancelled():
+                return None, None
 
             tweets = response.html.find('article[data-testid="tweet"]')
 
@@ -537,8 +617,8 @@ class TwitterScrapers:
 
         return None, None
 
-    def get_latest_tweet_nitter(self, username, use_proxies=False):
-        """Получает последний твит через Nitter"""
+    def get_latest_tweet_nitter(self, username, use_proxies=False, cancel=None):
+        """Получает последний твит через Nitter; cancel прерывает перебор инстансов"""
         cache_key = self.get_cache_key("nitter", username)
         cached = self.get_cached_data(cache_key)
         if cached:
@@ -549,6 +629,9 @@ class TwitterScrapers:
         random.shuffle(nitter_instances)
 
         for base_url in nitter_instances[:3]:
+            if cancel is not None and cancel.is_set():
+                logger.info(f"Проверка @{username} через Nitter отменена")
+                return None, None
             url = f"{base_url}/{username}"
             headers = {
                 "User-Agent": self.get_random_user_agent(),
@@ -619,55 +702,82 @@ class TwitterScrapers:
 
         return None, None
 
-    async def get_latest_tweet_multi(self, username, methods=None, use_proxies=False):
-        """Пытается получить последний твит разными методами одновременно"""
+    async def get_latest_tweet_multi(self, username, methods=None, use_proxies=False, last_known_id=None):
+        """Запускает методы одновременно и возвращает первый твит новее last_known_id.
+
+        Дорогие методы стартуют с задержкой из race_stagger, проигравшие отменяются.
+        Возвращает результаты завершившихся методов {метод: (tweet_id, tweet_data)} и победителя
+        (None, если нового твита никто не нашел).
+        """
         await self.init_async_session()
 
         if not methods:
             methods = ["apify", "nitter", "web"] if APIFY_API_TOKEN else ["nitter", "web"]
 
-        tasks = []
-
-        for method in methods:
-            if method == "apify":
-                tasks.append(asyncio.create_task(self.get_latest_tweet_apify(username, use_proxies)))
-            elif method == "nitter":
-                tasks.append(asyncio.create_task(self.get_latest_tweet_nitter_async(username, use_proxies)))
-            elif method == "web":
-                tasks.append(asyncio.create_task(self.get_latest_tweet_web_async(username, use_proxies)))
+        stagger = get_settings().get("race_stagger", {"nitter": 0, "apify": 0.5, "web": 1.5})
+        cancel = threading.Event()
+        finished = {}
 
-        done, pending = await asyncio.wait(
-            tasks,
-            return_when=asyncio.FIRST_COMPLETED
-        )
-
-        for task in pending:
-            task.cancel()
+        def method_stats(method):
+            return race_stats.setdefault(method, {"started": 0, "won": 0, "lost": 0, "cancelled": 0, "time": 0.0})
 
-        result = None
-        for task in done:
+        async def run(method):
+            await asyncio.sleep(stagger.get(method, 0))
+            method_stats(method)["started"] += 1
+            started = time.time()
             try:
-                method_result = task.result()
-                if method_result and method_result[0]:
-                    result = method_result
-                    break
+                if method == "apify":
+                    result = await self.get_latest_tweet_apify(username, use_proxies)
+                elif method == "nitter":
+                    result = await asyncio.to_thread(self.get_latest_tweet_nitter, username, use_proxies, cancel)
+                elif method == "web":
+                    result = await asyncio.to_thread(self.get_latest_tweet_web, username, use_proxies, cancel)
+                else:
+                    result = None, None
             except Exception as e:
                 logger.error(f"Ошибка в асинхронной задаче для {username}: {e}")
+                result = None, None
+            finally:
+                method_stats(method)["time"] += time.time() - started
+            return method, result
 
-        return result
+        tasks = [asyncio.create_task(run(method)) for method in methods]
+        winner = None
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                method, (tweet_id, tweet_data) = await next_result
+                finished[method] = (tweet_id, tweet_data)
+                if not tweet_id:
+                    continue
+                try:
+                    newer = not last_known_id or int(tweet_id) > int(last_known_id)
+                except (ValueError, TypeError):
+                    newer = False
+                if newer:
+                    winner = method
+                    break
+        finally:
+            cancel.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
-    async def get_latest_tweet_web_async(self, username, use_proxies=False):
-        return self.get_latest_tweet_web(username, use_proxies)
+        for method in methods:
+            if method == winner:
+                method_stats(method)["won"] += 1
+            elif method in finished:
+                method_stats(method)["lost"] += 1
+            else:
+                method_stats(method)["cancelled"] += 1
 
-    async def get_latest_tweet_nitter_async(self, username, use_proxies=False):
-        return self.get_latest_tweet_nitter(username, use_proxies)
+        return finished, winner
 
 
 # Многометодная проверка твитов
-async def check_tweet_multi_method(username, methods=None, use_proxies=False):
-    """Проверяет твиты всеми доступными методами"""
+async def check_tweet_multi_method(username, methods=None, use_proxies=False, last_known_id=None):
+    """Проверяет твиты всеми доступными методами; last_known_id нужен гонке методов"""
+    settings = get_settings()
     if not methods:
-        settings = get_settings()
         methods = settings.get("scraper_methods",
                                ["api", "apify", "web", "nitter"] if APIFY_API_TOKEN else ["api", "web", "nitter"])
 
@@ -681,6 +791,22 @@ async def check_tweet_multi_method(username, methods=None, use_proxies=False):
     tweet_data = None
     successful_method = None
 
+    # В режиме гонки скраперы работают одновременно, API остается запасным методом
+    if settings.get("race_methods", False) and len([m for m in methods if m != "api"]) > 1:
+        finished, winner = await scrapers.get_latest_tweet_multi(
+            username, [m for m in methods if m != "api"], use_proxies, last_known_id)
+        if winner:
+            tweet_id, tweet_data = finished[winner]
+            successful_method = winner
+        else:
+            # Нового твита нет: берем самый новый из найденных, иначе тихий аккаунт
+            # считался бы недоступным и попал бы в негативный кеш
+            found = [(method, result) for method, result in finished.items()
+                     if scrapers.validate_tweet_id(username, result[0]) and str(result[0]).isdigit()]
+            if found:
+                successful_method, (tweet_id, tweet_data) = max(found, key=lambda item: int(item[1][0]))
+        methods = [m for m in methods if m == "api"]
+
     for method in methods:
         if tweet_id:
             break
@@ -752,6 +878,13 @@ async def on_startup(app):
     except Exception as e:
         logger.error(f"Ошибка при обновлении Nitter-инстансов: {e}")
 
+    # Определяем chromedriver один раз, а не при каждой веб-проверке
+    if "web" in get_settings().get("scraper_methods", []):
+        try:
+            await asyncio.to_thread(resolve_chromedriver)
+        except Exception as e:
+            logger.error(f"Не удалось определить chromedriver: {e}")
+
     # Запускаем фоновую задачу
     background_task = asyncio.create_task(background_check(app))
     logger.info("Бот запущен, фоновая задача активирована")
@@ -768,6 +901,9 @@ async def on_shutdown(app):
             pass
         logger.info("Фоновая задача остановлена")
 
+    # Останавливаем обработчики проверок и досылаем найденные твиты
+    await stop_pipeline()
+
     # Закрываем все асинхронные сессии
     scrapers = TwitterScrapers()
     await scrapers.close_async_session()
@@ -775,6 +911,98 @@ async def on_shutdown(app):
 # Глобальная переменная для фоновой задачи
 background_task = None
 
+# Непрерывный конвейер проверки: очередь аккаунтов к проверке, долгоживущие
+# обработчики и отдельная задача отправки уведомлений
+check_queue = None
+notify_queue = None
+notify_task = None
+check_workers = []
+check_workers_stopping = 0
+
+
+async def check_worker(app, worker_id):
+    """Берет аккаунты из очереди по одному: медленная проверка задерживает только свой обработчик"""
+    global check_workers_stopping
+    while True:
+        job = await check_queue.get()
+        try:
+            if job is None:
+                # Сигнал на уменьшение числа обработчиков
+                check_workers_stopping -= 1
+                return
+            if await process_account(app, job["subs"], job["accounts"], job["username"],
+                                     job["account"], job["methods"], job["use_proxies"]):
+                job["sweep"]["updated"] = True
+        except Exception as e:
+            logger.error(f"Ошибка в обработчике {worker_id} при проверке @{job['username']}: {e}")
+        finally:
+            check_queue.task_done()
+
+
+async def notify_worker(app):
+    """Отправляет уведомления о новых твитах по мере их обнаружения"""
+    while True:
+        subs, username, tweet_id, tweet_data = await notify_queue.get()
+        try:
+            await send_tweet_notification(app, subs, username, tweet_id, tweet_data)
+        except Exception as e:
+            logger.error(f"Ошибка отправки уведомления о твите {tweet_id} @{username}: {e}")
+        finally:
+            notify_queue.task_done()
+
+
+async def publish_new_tweet(app, subs, username, tweet_id, tweet_data):
+    """Передает новый твит на отправку; без запущенного конвейера отправляет сразу"""
+    if notify_queue is not None:
+        await notify_queue.put((subs, username, tweet_id, tweet_data))
+    else:
+        await send_tweet_notification(app, subs, username, tweet_id, tweet_data)
+
+
+def start_pipeline(app, workers):
+    """Запускает очереди, отправку уведомлений и нужное число обработчиков"""
+    global check_queue, notify_queue, notify_task
+    if check_queue is None:
+        check_queue = asyncio.Queue()
+        notify_queue = asyncio.Queue()
+        notify_task = asyncio.create_task(notify_worker(app))
+    resize_check_workers(app, workers)
+
+
+def resize_check_workers(app, workers):
+    """Доводит число работающих обработчиков до workers"""
+    global check_workers_stopping
+    check_workers[:] = [task for task in check_workers if not task.done()]
+    active = len(check_workers) - check_workers_stopping
+    for _ in range(workers - active):
+        check_workers.append(asyncio.create_task(check_worker(app, len(check_workers) + 1)))
+    for _ in range(active - workers):
+        check_workers_stopping += 1
+        check_queue.put_nowait(None)
+
+
+async def stop_pipeline():
+    """Останавливает обработчики и дожидается отправки уже найденных твитов"""
+    global check_queue, notify_queue, notify_task, check_workers_stopping
+    for task in check_workers:
+        task.cancel()
+    await asyncio.gather(*check_workers, return_exceptions=True)
+    check_workers.clear()
+    check_workers_stopping = 0
+
+    if notify_queue is not None:
+        try:
+            await asyncio.wait_for(notify_queue.join(), timeout=15)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не отправлено уведомлений: {notify_queue.qsize()}")
+        notify_task.cancel()
+        await asyncio.gather(notify_task, return_exceptions=True)
+
+    check_queue = None
+    notify_queue = None
+    notify_task = None
+
+
 async def background_check(app):
     """Фоновая проверка аккаунтов"""
     global background_task
@@ -821,36 +1049,27 @@ async def background_check(app):
                 )
             )
 
-            # Проверяем аккаунты группами для параллельной обработки
-            for i in range(0, len(sorted_accounts), parallel_checks):
-                # Если задача отменена, выходим
-                if asyncio.current_task().cancelled():
-                    logger.info("Фоновая задача отменена")
-                    return
-
-                # Берем очередную группу аккаунтов
-                batch = sorted_accounts[i:i + parallel_checks]
-                tasks = []
-
-                # Создаем задачи для параллельной проверки аккаунтов
-                for username, account in batch:
-                    if asyncio.current_task().cancelled():
-                        break
-
-                    display_name = account.get('username', username)
-                    tasks.append(process_account(app, subs, accounts, display_name, account, methods, use_proxies))
-
-                # Запускаем все задачи параллельно
-                if tasks:
-                    results = await asyncio.gather(*tasks, return_exceptions=True)
-                    for result in results:
-                        if isinstance(result, Exception):
-                            logger.error(f"Ошибка в параллельной проверке: {result}")
-                        elif result:  # Если был обновлен аккаунт
-                            accounts_updated = True
-
-                # Небольшая задержка между группами
-                await asyncio.sleep(3)
+            # Ставим аккаунты в очередь: каждый обработчик берет следующий, как только освободится,
+            # а новые твиты уходят на отправку сразу после своей проверки
+            start_pipeline(app, parallel_checks)
+            sweep = {"updated": False}
+            now = time.time()
+            for username, account in sorted_accounts:
+                # Аккаунты из негативного кеша ждут своей пробной проверки
+                negative = account.get("negative")
+                if negative and settings.get("negative_cache", True) and negative["next_probe"] > now:
+                    continue
+                check_queue.put_nowait({
+                    "subs": subs,
+                    "accounts": accounts,
+                    "username": account.get('username', username),
+                    "account": account,
+                    "methods": methods,
+                    "use_proxies": use_proxies,
+                    "sweep": sweep
+                })
+            await check_queue.join()
+            accounts_updated = sweep["updated"]
 
             # Сохраняем обновленные данные
             if accounts_updated:
@@ -879,6 +1098,50 @@ async def background_check(app):
             # Не останавливаем задачу при ошибках
             await asyncio.sleep(60)
 
+
+async def send_tweet_notification(app, subs, username, tweet_id, tweet_data):
+    """Отправляет новый твит всем подписчикам"""
+    tweet_text = tweet_data.get('text', '[Новый твит]')
+    tweet_url = tweet_data.get('url', f"https://twitter.com/{username}/status/{tweet_id}")
+    tweet_msg = f"🐦 @{username}:\n\n{tweet_text}\n\n{tweet_url}"
+
+    for chat_id in subs:
+        try:
+            await app.bot.send_message(chat_id=chat_id, text=tweet_msg,
+                                       disable_web_page_preview=False)
+            await asyncio.sleep(0.5)  # Небольшая задержка
+        except Exception as e:
+            logger.error(f"Ошибка отправки сообщения в чат {chat_id}: {e}")
+
+
+def mark_negative(username, account, settings, now):
+    """Выводит аккаунт из обычных проверок до пробной проверки; каждая неудачная проба удваивает паузу"""
+    negative = account.get("negative")
+    if negative:
+        negative["probes"] += 1
+    else:
+        negative = account["negative"] = {"reason": "unreachable", "since": now, "probes": 0}
+        logger.warning(f"@{username}: ни один метод не находит твиты, аккаунт выведен из обычных проверок")
+
+    backoff = settings.get("negative_base_backoff", 1800) * 2 ** negative["probes"]
+    negative["next_probe"] = now + min(backoff, settings.get("negative_max_backoff", 86400))
+
+
+def probe_methods(account, methods, settings):
+    """Методы для пробной проверки аккаунта из негативного кеша.
+
+    Дешевые методы из negative_probe_methods и метод последней успешной проверки; после
+    negative_widen_after неудачных проб - все методы.
+    """
+    if account["negative"]["probes"] >= settings.get("negative_widen_after", 3):
+        return methods
+    probe = [m for m in settings.get("negative_probe_methods", ["nitter"]) if m in methods]
+    last_method = account.get("check_method")
+    if last_method in methods and last_method not in probe:
+        probe.append(last_method)
+    return probe or methods
+
+
 async def process_account(app, subs, accounts, username, account, methods, use_proxies):
     """Обрабатывает один аккаунт и отправляет уведомления при новых твитах"""
     try:
@@ -890,9 +1153,16 @@ async def process_account(app, subs, accounts, username, account, methods, use_p
         last_id = account.get('last_tweet_id')
         first_check = account.get('first_check', False)
 
+        # Аккаунт из негативного кеша проверяем дешевыми методами и последним успешным
+        settings = get_settings()
+        negative = account.get("negative") if settings.get("negative_cache", True) else None
+        if negative:
+            methods = probe_methods(account, methods, settings)
+            logger.info(f"Пробная проверка @{username}, методы: {methods}")
+
         # Используем мультиметодную проверку
         user_id, tweet_id, tweet_data, method = await check_tweet_multi_method(
-            username, methods, use_proxies
+            username, methods, use_proxies, last_id
         )
 
         # Обновляем ID пользователя, если получили новый
@@ -913,9 +1183,20 @@ async def process_account(app, subs, accounts, username, account, methods, use_p
             if account.get('fail_count', 0) > 3:
                 account['priority'] = max(0.1, account.get('priority', 1.0) * 0.9)
 
+            # Неудачная проба продлевает паузу; серия неудач всех методов выводит аккаунт из проверок
+            account['fail_streak'] = account.get('fail_streak', 0) + 1
+            if negative or (settings.get("negative_cache", True) and
+                            account['fail_streak'] >= settings.get("negative_after_failures", 5)):
+                mark_negative(username, account, settings, time.time())
+
             logger.info(f"Аккаунт @{username}: твиты не найдены (методы: {methods})")
             return True
 
+        # Аккаунт снова доступен
+        account.pop('fail_streak', None)
+        if account.pop('negative', None):
+            logger.info(f"Аккаунт @{username} снова доступен")
+
         # Сбрасываем счетчик неудач при успехе и восстанавливаем приоритет
         if account.get('fail_count', 0) > 0:
             account['fail_count'] = max(0, account.get('fail_count', 0) - 1)
@@ -952,19 +1233,9 @@ async def process_account(app, subs, accounts, username, account, methods, use_p
                 account['last_tweet_id'] = tweet_id
                 logger.info(f"Аккаунт @{username}: новый твит {tweet_id}, отправляем уведомления")
 
-                # Отправляем уведомления всем подписчикам
+                # Передаем твит на отправку уведомлений, не дожидаясь ее
                 if tweet_data:
-                    tweet_text = tweet_data.get('text', '[Новый твит]')
-                    tweet_url = tweet_data.get('url', f"https://twitter.com/{username}/status/{tweet_id}")
-                    tweet_msg = f"🐦 @{username}:\n\n{tweet_text}\n\n{tweet_url}"
-
-                    for chat_id in subs:
-                        try:
-                            await app.bot.send_message(chat_id=chat_id, text=tweet_msg,
-                                                       disable_web_page_preview=False)
-                            await asyncio.sleep(0.5)  # Небольшая задержка
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки сообщения в чат {chat_id}: {e}")
+                    await publish_new_tweet(app, subs, username, tweet_id, tweet_data)
                 return True
             else:
                 # ID изменился, но твит старее - просто обновляем ID
@@ -1122,6 +1393,11 @@ async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         msg += f"• @{display_name} (ID: {tweet_id}, {success_rate:.0f}%, метод: {method}, проверка: {last_check})"
 
+        negative = data.get("negative")
+        if negative:
+            next_probe = datetime.fromtimestamp(negative["next_probe"]).strftime("%d.%m %H:%M")
+            msg += f"\n  🚫 Не проверяется: твиты не найдены, проба {next_probe} (неудачных проб: {negative['probes']})"
+
         if tweet_text:
             short_text = tweet_text[:50] + "..." if len(tweet_text) > 50 else tweet_text
             msg += f"\n  ➡️ {short_text}"
@@ -1222,7 +1498,7 @@ async def cmd_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         try:
             user_id, tweet_id, tweet_data, method = await check_tweet_multi_method(
-                display_name, methods, use_proxies
+                display_name, methods, use_proxies, last_id
             )
 
             if user_id and not account.get('user_id'):
@@ -1535,6 +1811,12 @@ async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         percent = 100.0 * count / len(accounts)
         msg += f"• {method}: {count} ({percent:.1f}%)\n"
 
+    if race_stats:
+        msg += "\n**Гонка методов:**\n"
+        for method, stats in race_stats.items():
+            msg += (f"• {method}: побед {stats['won']}, проигрышей {stats['lost']}, "
+                    f"отменено {stats['cancelled']}\n")
+
     msg += "\n**Самые надежные аккаунты:**\n"
     for username, rate in most_reliable:
         msg += f"• @{accounts[username].get('username', username)}: {rate:.1f}%\n"
@@ -1627,7 +1909,17 @@ def main():
             "min_interval_factor": 0.8,
             "max_interval_factor": 1.2,
             "parallel_checks": 3,
-            "nitter_instances": NITTER_INSTANCES
+            "nitter_instances": NITTER_INSTANCES,
+            "chromedriver_path": "",
+            "web_ready_timeout": 10,
+            "race_methods": False,
+            "race_stagger": {"nitter": 0, "apify": 0.5, "web": 1.5},
+            "negative_cache": True,
+            "negative_after_failures": 5,
+            "negative_base_backoff": 1800,
+            "negative_max_backoff": 86400,
+            "negative_probe_methods": ["nitter"],
+            "negative_widen_after": 3
         })
     ]:
         if not os.path.exists(path):
@@ -5,6 +5,9 @@ import logging
 import random
 import requests
 import re
+import base64
+import hashlib
+import codecs
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from telegram import Update, BotCommand, InlineKeyboardMarkup, InlineKeyboardButton
@@ -12,20 +15,44 @@ from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, Callb
 from telegram.error import TelegramError
 from bs4 import BeautifulSoup
 from fake_useragent import UserAgent
-from urllib.parse import quote
+from urllib.parse import quote, urlparse
+from html.parser import HTMLParser
 import aiohttp
 import traceback
 import asyncio
+import heapq
+import bisect
+import math
+import itertools
+import copy
+import queue
+import threading
+import multiprocessing
+import socket
+import sqlite3
+import concurrent.futures
+import contextlib
+import tempfile
+try:
+    import fcntl
+except ImportError:
+    # Windows: блокировка файла аккаунтов между узлами недоступна
+    fcntl = None
+from concurrent.futures import ProcessPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 from typing import Dict, List, Tuple, Any, Optional, Union
 import platform
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 logging.basicConfig(
     format="%(asctime)s %(levelname)s %(message)s",
     level=logging.INFO,
@@ -63,12 +90,281 @@ SUBSCRIBERS_FILE = os.path.join(DATA_DIR, "subscribers.json")
 SETTINGS_FILE = os.path.join(DATA_DIR, "settings.json")
 API_LIMITS_FILE = os.path.join(DATA_DIR, "api_limits.json")
 CACHE_FILE = os.path.join(DATA_DIR, "cache.json")
+VALIDATORS_FILE = os.path.join(DATA_DIR, "validators.json")
+JOURNAL_FILE = os.path.join(DATA_DIR, "accounts_journal.jsonl")
+OUTBOX_FILE = os.path.join(DATA_DIR, "notify_outbox.json")
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Тяжелые ресурсы и сторонние хосты, которые не нужны для чтения твитов со страницы.
+# Скрипты и XHR twitter.com/twimg.com не блокируются: без них лента не отрисуется.
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.m3u8", "*.m4s", "*.webm",
+    "*pbs.twimg.com/media/*", "*pbs.twimg.com/profile_images/*", "*pbs.twimg.com/profile_banners/*",
+    "*pbs.twimg.com/card_img/*", "*pbs.twimg.com/ext_tw_video_thumb/*", "*pbs.twimg.com/amplify_video_thumb/*",
+    "*video.twimg.com/*", "*abs.twimg.com/emoji/*", "*abs.twimg.com/fonts/*",
+    "*google-analytics.com/*", "*googletagmanager.com/*", "*doubleclick.net/*",
+    "*ads-twitter.com/*", "*ads-api.twitter.com/*", "*analytics.twitter.com/*",
+    "*/1.1/jot/*", "*/i/api/1.1/jot/*"
+]
+
+# Состояние страницы профиля: твиты отрисованы, стена логина или профиль недоступен.
+# Возвращает null, пока страница еще загружается или во вкладке осталась предыдущая страница.
+PAGE_STATE_SCRIPT = r"""
+    if (window.__tabStale) return null;
+
+    // Закрепленный твит рендерится первым; готова лента, когда есть обычный твит или их два.
+    // Если за PINNED_GRACE_MS других не появилось, у аккаунта только закрепленный твит
+    const PINNED_GRACE_MS = 3000;
+    const articles = document.querySelectorAll('article[data-testid="tweet"]');
+    if (articles.length) {
+        const context = articles[0].querySelector('[data-testid="socialContext"]');
+        const pinned = context && /Pinned|Закрепл/i.test(context.textContent);
+        if (articles.length >= 2 || !pinned) return 'tweets';
+        window.__pinnedSince = window.__pinnedSince || Date.now();
+        if (Date.now() - window.__pinnedSince > PINNED_GRACE_MS) return 'tweets';
+        return null;
+    }
+    if (/^\/(i\/flow\/)?login/.test(location.pathname)) return 'login_wall';
+
+    const empty = document.querySelector('[data-testid="emptyState"]');
+    const text = empty ? empty.innerText : (document.body ? document.body.innerText : '');
+    if (/Account suspended|аккаунт заблокирован/i.test(text)) return 'suspended';
+    if (/account doesn.t exist|аккаунт не существует/i.test(text)) return 'not_found';
+    if (/(posts|Tweets) are protected|твиты защищены|посты защищены/i.test(text)) return 'protected';
+
+    if (document.querySelector('[data-testid="loginButton"], [data-testid="login"]') &&
+        document.querySelector('[data-testid="sheetDialog"], [role="dialog"]')) return 'login_wall';
+    return null;
+"""
+
+# Метрики загрузки страниц веб-методом: с блокировкой ресурсов и без нее. Пишутся из потоков
+# проверок, поэтому под замком; первая загрузка браузера (холодный старт) не учитывается
+web_metrics = {
+    "blocking": {"loads": 0, "load_time": 0.0, "blocked": 0},
+    "no_blocking": {"loads": 0, "load_time": 0.0, "blocked": 0}
+}
+web_metrics_lock = threading.Lock()
+
+# Типизированные исходы веб-проверки, когда твитов на странице нет
+DEAD_ACCOUNT_OUTCOMES = ("suspended", "not_found", "protected")
+PAGE_OUTCOMES = ("login_wall",) + DEAD_ACCOUNT_OUTCOMES
+OUTCOME_LABELS = {
+    "login_wall": "стена логина",
+    "suspended": "аккаунт заблокирован",
+    "not_found": "аккаунт не существует",
+    "protected": "твиты защищены"
+}
+
+# Последний исход веб-проверки по аккаунту; забирается в process_account
+last_check_outcomes = {}
+
+# До какого времени веб-метод не используется после стены логина (она общая для IP)
+web_login_wall_until = 0
+
+
+class CheckCancelled(Exception):
+    """Проверка отменена: другой метод в гонке уже нашел новый твит"""
+
+
+# Откуда веб-метод взял твиты: из перехваченного JSON ленты или из DOM
+capture_stats = {"json": 0, "dom": 0}
+
+# GraphQL-запросы, которыми страница профиля загружает ленту твитов
+TIMELINE_OPERATION_RE = re.compile(r"/graphql/[^/]+/(UserTweets|UserTweetsAndReplies|UserMedia)\b")
+
+
+def timeline_tweet_results(payload):
+    """Достает из ответа GraphQL пары (результат твита, признак закрепления)"""
+    user_result = payload.get("data", {}).get("user", {}).get("result", {})
+    timeline = user_result.get("timeline_v2") or user_result.get("timeline") or {}
+    instructions = timeline.get("timeline", {}).get("instructions", [])
+
+    for instruction in instructions:
+        if instruction.get("type") == "TimelinePinEntry":
+            entries = [instruction.get("entry", {})]
+            pinned = True
+        elif instruction.get("type") == "TimelineAddEntries":
+            entries = instruction.get("entries", [])
+            pinned = False
+        else:
+            continue
+
+        for entry in entries:
+            content = entry.get("content", {})
+            item_contents = [content.get("itemContent", {})]
+            # Ветки и подборки приходят модулем из нескольких твитов
+            item_contents += [item.get("item", {}).get("itemContent", {}) for item in content.get("items", [])]
+
+            for item_content in item_contents:
+                result = item_content.get("tweet_results", {}).get("result")
+                if not result:
+                    continue
+                if result.get("__typename") == "TweetWithVisibilityResults":
+                    result = result.get("tweet", {})
+                if result.get("legacy"):
+                    yield result, pinned
+
+
+def parse_timeline_json(payload):
+    """Разбирает JSON ленты пользователя в тот же формат, что и DOM-извлекатель веб-метода"""
+    tweets = []
+    for result, pinned in timeline_tweet_results(payload):
+        legacy = result["legacy"]
+        tweet_id = legacy.get("id_str") or result.get("rest_id")
+        if not tweet_id:
+            continue
+
+        # Длинные твиты приходят обрезанными, полный текст лежит в note_tweet
+        text = legacy.get("full_text", "")
+        note = result.get("note_tweet", {}).get("note_tweet_results", {}).get("result", {})
+        if note.get("text"):
+            text = note["text"]
+
+        timestamp = ""
+        display_date = ""
+        if legacy.get("created_at"):
+            try:
+                dt = datetime.strptime(legacy["created_at"], "%a %b %d %H:%M:%S %z %Y")
+                timestamp = dt.isoformat()
+                display_date = dt.strftime("%d %b %Y, %H:%M")
+            except ValueError:
+                display_date = legacy["created_at"]
+
+        media = []
+        for item in legacy.get("extended_entities", {}).get("media", []):
+            if item.get("type") == "photo":
+                media.append({"type": "photo", "url": f"{item.get('media_url_https', '')}?name=large"})
+            elif item.get("type") in ("video", "animated_gif"):
+                variants = [v for v in item.get("video_info", {}).get("variants", [])
+                            if v.get("content_type") == "video/mp4"]
+                if variants:
+                    best = max(variants, key=lambda v: v.get("bitrate", 0))
+                    media.append({"type": "video", "url": best["url"]})
+
+        tweets.append({
+            "id": tweet_id,
+            "text": text,
+            "timestamp": timestamp,
+            "displayDate": display_date,
+            "isPinned": pinned,
+            "hasMedia": bool(media),
+            "media": media,
+            "likes": legacy.get("favorite_count", 0),
+            "retweets": legacy.get("retweet_count", 0)
+        })
+    return tweets
+
+
+# Сбор твитов из DOM страницы профиля, если JSON ленты перехватить не удалось
+DOM_TWEETS_SCRIPT = r"""
+    function extractTweets() {
+        const tweets = [];
+        try {
+            const tweetElements = document.querySelectorAll('article[data-testid="tweet"]');
+            console.log(`Найдено ${tweetElements.length} твитов на странице`);
+
+            for (const article of tweetElements) {
+                try {
+                    const socialContext = article.querySelector('[data-testid="socialContext"]');
+                    const isPinned = socialContext && 
+                        (socialContext.textContent.includes('Pinned') || 
+                         socialContext.textContent.includes('Закрепленный') ||
+                         socialContext.textContent.includes('закреплен'));
+
+                    let tweetId = null;
+                    const links = article.querySelectorAll('a[href*="/status/"]');
+                    for (const link of links) {
+                        const match = link.href.match(/\/status\/(\d+)/);
+                        if (match && match[1]) {
+                            tweetId = match[1];
+                            break;
+                        }
+                    }
+
+                    if (!tweetId) continue;
+
+                    const textElement = article.querySelector('[data-testid="tweetText"]');
+                    const tweetText = textElement ? textElement.innerText : '';
+
+                    let timestamp = '';
+                    let displayDate = '';
+                    const timeElement = article.querySelector('time');
+                    if (timeElement) {
+                        timestamp = timeElement.getAttribute('datetime');
+                        displayDate = timeElement.innerText;
+                    }
+
+                    const photoElements = article.querySelectorAll('[data-testid="tweetPhoto"]');
+                    const mediaUrls = [];
+
+                    for (const photoEl of photoElements) {
+                        const img = photoEl.querySelector('img');
+                        if (img && img.src) {
+                            let imgUrl = img.src;
+                            imgUrl = imgUrl.replace('&name=small', '&name=large');
+                            imgUrl = imgUrl.replace('&name=thumb', '&name=large');
+                            mediaUrls.push({
+                                type: 'photo',
+                                url: imgUrl
+                            });
+                        }
+                    }
+
+                    tweets.push({
+                        id: tweetId,
+                        text: tweetText,
+                        timestamp: timestamp,
+                        displayDate: displayDate,
+                        isPinned: isPinned,
+                        hasMedia: photoElements.length > 0,
+                        media: mediaUrls
+                    });
+                } catch(e) {
+                    console.error("Ошибка обработки твита:", e);
+                }
+            }
+        } catch(e) {
+            console.error("Ошибка сбора твитов:", e);
+        }
+
+        return tweets;
+    }
+    return extractTweets();
+"""
+
+
+# Путь к chromedriver определяется один раз при запуске бота
+chromedriver_path = None
+chromedriver_lock = threading.Lock()
+
+
+def resolve_chromedriver():
+    """Возвращает путь к chromedriver: явно заданный или найденный ChromeDriverManager"""
+    global chromedriver_path
+    with chromedriver_lock:
+        if chromedriver_path:
+            return chromedriver_path
+
+        # Явно указанный локальный chromedriver позволяет работать без сети
+        configured = os.getenv("CHROMEDRIVER_PATH") or get_settings().get("chromedriver_path")
+        if configured:
+            if not os.path.isfile(configured):
+                raise FileNotFoundError(f"chromedriver не найден: {configured}")
+            chromedriver_path = configured
+        else:
+            chromedriver_path = ChromeDriverManager().install()
+
+        logger.info(f"Используется chromedriver: {chromedriver_path}")
+        return chromedriver_path
+
 
 class HTMLSession:
-    def __init__(self):
+    """Браузер Chrome, в котором одновременно может работать несколько вкладок"""
+
+    def __init__(self, cookie_set=None):
         self.retry_count = 0
         self.max_retries = 2
         self.browser_name = "Chrome"
@@ -88,9 +384,21 @@ class HTMLSession:
         options.add_argument(
             "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
 
+        # Фоновые вкладки не должны замедляться: все они загружают страницы одновременно
+        options.add_argument("--disable-background-timer-throttling")
+        options.add_argument("--disable-renderer-backgrounding")
+        options.add_argument("--disable-backgrounding-occluded-windows")
+
+        # Не ждем полной загрузки: готовность страницы определяется по появлению твитов
+        options.page_load_strategy = "eager"
+
+        # Журнал производительности нужен для подсчета заблокированных запросов
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+
         try:
             self.driver = webdriver.Chrome(
-                service=ChromeService(ChromeDriverManager().install()),
+                service=ChromeService(resolve_chromedriver()),
                 options=options
             )
             self.driver.set_page_load_timeout(25)
@@ -99,9 +407,160 @@ class HTMLSession:
             raise
 
         self.driver.implicitly_wait(10)
+        self.pages_loaded = 0
+
+        # WebDriver выполняет команды только в текущей вкладке, поэтому все команды
+        # идут под замком с переключением на нужную вкладку
+        self.lock = threading.RLock()
+        self.current_handle = self.driver.current_window_handle
+        self.free_handles = [self.current_handle]
+        self.tab_count = 1
+        self.leased = 0
+        self.retiring = False
+        self.tab_events = {}
+
+        self.block_resources = get_settings().get("browser_block_resources", True)
+        self.setup_tab()
+
+        # Cookie общие для всех вкладок браузера, поэтому набор выбирается на весь браузер
+        self.cookie_set = cookie_set
+        if cookie_set:
+            try:
+                self.driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookie_set.cdp_cookies()})
+                logger.info(f"Браузер авторизован cookie из {cookie_set.path}")
+            except Exception as e:
+                cookie_set.mark_unhealthy(f"не удалось установить cookie: {e}")
+                self.cookie_set = None
+
         logger.info(f"WebDriver Chrome инициализирован")
 
-    def get(self, url, timeout=25):
+    def setup_tab(self):
+        """Включает Network в DevTools для текущей вкладки и блокировку тяжелых ресурсов"""
+        # Сеть в DevTools нужна и для блокировки ресурсов, и для чтения ответов ленты
+        try:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+        except Exception as e:
+            logger.warning(f"Не удалось включить Network в DevTools: {e}")
+
+        # Блокируем картинки, шрифты, видео и аналитику через DevTools
+        if self.block_resources:
+            try:
+                self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+            except Exception as e:
+                logger.warning(f"Не удалось включить блокировку ресурсов: {e}")
+                self.block_resources = False
+
+    def set_blocking(self, enabled):
+        """Включает или снимает блокировку ресурсов в текущей вкладке; вызывается под self.lock"""
+        self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS if enabled else []})
+
+    def switch_to(self, handle):
+        """Делает вкладку текущей; вызывается под self.lock"""
+        if self.current_handle != handle:
+            self.driver.switch_to.window(handle)
+            self.current_handle = handle
+
+    def lease_tab(self):
+        """Выдает свободную вкладку, при необходимости открывая новую"""
+        with self.lock:
+            if self.free_handles:
+                handle = self.free_handles.pop()
+            else:
+                self.driver.switch_to.new_window("tab")
+                handle = self.current_handle = self.driver.current_window_handle
+                self.tab_count += 1
+                self.setup_tab()
+            self.leased += 1
+            return BrowserTab(self, handle)
+
+    def release_tab(self, tab):
+        """Возвращает вкладку в браузер"""
+        with self.lock:
+            self.leased -= 1
+            self.free_handles.append(tab.handle)
+
+    def take_events(self, handle):
+        """Сетевые события вкладки из общего журнала производительности Chrome"""
+        with self.lock:
+            for event in self.drain_performance_log():
+                # webview - идентификатор вкладки в DevTools, совпадает с ее handle
+                self.tab_events.setdefault(event.get("webview", ""), []).append(event)
+            # События вкладок, которые сейчас никто не ждет, не копим
+            self.tab_events.pop("", None)
+            return self.tab_events.pop(handle.replace("CDwindow-", ""), [])
+
+    def drain_performance_log(self):
+        """Забирает накопленные сетевые события из журнала производительности Chrome"""
+        try:
+            entries = self.driver.get_log("performance")
+        except Exception:
+            return []
+
+        events = []
+        for entry in entries:
+            try:
+                events.append(json.loads(entry["message"]))
+            except (KeyError, ValueError):
+                continue
+        return events
+
+    def is_healthy(self):
+        """Проверяет, что браузер отвечает на команды и его cookie еще действуют"""
+        if self.cookie_set and (not self.cookie_set.healthy or self.cookie_set.expired()):
+            return False
+        try:
+            with self.lock:
+                return self.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def rss_mb(self):
+        """Память, занятая chromedriver и дочерними процессами Chrome, в МБ"""
+        try:
+            return process_tree_rss_mb(self.driver.service.process.pid)
+        except Exception:
+            return 0
+
+    def close(self):
+        try:
+            self.driver.quit()
+            logger.info(f"WebDriver закрыт")
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии WebDriver: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class BrowserTab:
+    """Вкладка браузера, в которой выполняется одна веб-проверка"""
+
+    def __init__(self, browser, handle):
+        self.browser = browser
+        self.handle = handle
+        self.network_events = []
+        self.page_state = None
+        # Загрузка, метрики которой еще не записаны: режим, время до готовности, холодный старт
+        self.load_mode = None
+        self.load_time = 0.0
+        self.cold_load = False
+
+    def command(self, func, *args):
+        """Выполняет команду WebDriver в этой вкладке"""
+        with self.browser.lock:
+            self.browser.switch_to(self.handle)
+            return func(*args)
+
+    def execute_script(self, script, *args):
+        return self.command(self.browser.driver.execute_script, script, *args)
+
+    def execute_cdp_cmd(self, cmd, params):
+        return self.command(self.browser.driver.execute_cdp_cmd, cmd, params)
+
+    def get(self, url, timeout=25, cancel=None):
         try:
             # Добавляем параметры для обхода кеширования
             if '?' not in url:
@@ -110,15 +569,33 @@ class HTMLSession:
                 url += f"&_={int(time.time())}"
 
             logger.info(f"Загружаю страницу: {url}")
-            self.driver.get(url)
-
-            # Ждем загрузку контента
-            WebDriverWait(self.driver, timeout).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-
-            # Даем время для загрузки динамического контента
-            time.sleep(random.uniform(2, 3.5))
+            self.browser.pages_loaded += 1
+
+            # Метрики предыдущей страницы этой вкладки, ее события дальше не нужны
+            self.finish_load()
+            self.browser.take_events(self.handle)
+
+            # Контрольная доля загрузок идет без блокировки в тех же браузерах: иначе режимы
+            # сравнивались бы на разных браузерах (без блокировки работают только те, где она не включилась)
+            blocking = self.browser.block_resources
+            if blocking and random.random() < get_settings().get("web_metrics_control_rate", 0.1):
+                self.command(self.browser.set_blocking, False)
+                blocking = False
+            self.load_mode = "blocking" if blocking else "no_blocking"
+            self.cold_load = self.browser.pages_loaded == 1
+            start_time = time.time()
+
+            # Переход через JS не держит браузер, пока страница грузится,
+            # и остальные вкладки продолжают работать
+            self.page_state = None
+            self.execute_script("window.__tabStale = true; window.location.href = arguments[0];", url)
+
+            # Ждем появления твитов или признаков недоступного профиля вместо фиксированной паузы
+            self.wait_ready(min(timeout, get_settings().get("web_ready_timeout", 10)), cancel)
+
+            # События к моменту готовности нужны для чтения JSON ленты; метрики пишутся при закрытии
+            self.load_time = time.time() - start_time
+            self.network_events = self.browser.take_events(self.handle)
 
             return self
 
@@ -126,27 +603,412 @@ class HTMLSession:
             logger.error(f"Ошибка при загрузке страницы {url}: {e}")
             return self
 
-    @property
-    def html(self):
-        return self.driver
+    def wait_ready(self, timeout, cancel=None):
+        """Ждет, пока страница покажет твиты, стену логина или недоступный профиль"""
+        def poll(driver):
+            if cancel is not None and cancel.is_set():
+                raise CheckCancelled()
+            return self.execute_script(PAGE_STATE_SCRIPT)
 
-    def close(self):
         try:
-            self.driver.quit()
-            logger.info(f"WebDriver закрыт")
+            self.page_state = WebDriverWait(self.browser.driver, timeout, poll_frequency=0.25).until(poll)
+        except CheckCancelled:
+            # Останавливаем загрузку, чтобы вкладка не тратила трафик на ненужную страницу
+            self.page_state = "cancelled"
+            self.execute_script("window.stop();")
+        except TimeoutException:
+            self.page_state = "timeout"
+            logger.warning(f"Страница не показала твиты за {timeout} с")
+        return self.page_state
+
+    def capture_timeline_json(self):
+        """Твиты из ответов GraphQL, которые страница получила во время последней загрузки"""
+        request_ids = [
+            event["message"]["params"]["requestId"]
+            for event in self.network_events
+            if event.get("message", {}).get("method") == "Network.responseReceived"
+            and TIMELINE_OPERATION_RE.search(event["message"].get("params", {}).get("response", {}).get("url", ""))
+        ]
+
+        tweets = []
+        for request_id in request_ids:
+            try:
+                response = self.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+                body = response.get("body", "")
+                if response.get("base64Encoded"):
+                    body = base64.b64decode(body).decode("utf-8")
+                tweets.extend(parse_timeline_json(json.loads(body)))
+            except Exception as e:
+                # Тело могло быть уже выгружено из буфера DevTools
+                logger.debug(f"Не удалось прочитать ответ ленты {request_id}: {e}")
+        return tweets
+
+    def finish_load(self):
+        """Записывает метрики загрузки страницы, когда вкладка уходит с нее.
+
+        Запросы продолжаются и после готовности ленты, поэтому заблокированные считаются
+        по журналу производительности на момент закрытия страницы, а не при готовности.
+        """
+        mode, self.load_mode = self.load_mode, None
+        if mode is None:
+            return
+        try:
+            events = self.network_events + self.browser.take_events(self.handle)
+            if mode == "no_blocking" and self.browser.block_resources:
+                # Контрольная загрузка закончена, возвращаем блокировку вкладке
+                self.command(self.browser.set_blocking, True)
         except Exception as e:
-            logger.error(f"Ошибка при закрытии WebDriver: {e}")
+            logger.warning(f"Не удалось завершить учет загрузки страницы: {e}")
+            return
 
-    def __enter__(self):
-        return self
+        blocked = sum(
+            1 for event in events
+            if event.get("message", {}).get("method") == "Network.loadingFailed"
+            and event["message"].get("params", {}).get("blockedReason") == "inspector"
+        )
+        if not self.cold_load:
+            with web_metrics_lock:
+                metrics = web_metrics[mode]
+                metrics["loads"] += 1
+                metrics["load_time"] += self.load_time
+                metrics["blocked"] += blocked
 
-    def __exit__(self, *args):
-        self.close()
+        logger.info(f"Страница загружена за {self.load_time:.1f} с, заблокировано запросов: {blocked}" +
+                    (", без блокировки (контроль)" if mode == "no_blocking" and self.browser.block_resources else ""))
+
+
+def process_tree_rss_mb(pid):
+    """Суммарный RSS процесса и всех его потомков в МБ"""
+    if psutil:
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        except psutil.Error:
+            return 0
+
+    # Без psutil читаем /proc (только Linux)
+    if not os.path.isdir("/proc"):
+        return 0
+
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    total_kb = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except (OSError, ValueError):
+            continue
+
+    return total_kb / 1024
+
+
+class CookieSet:
+    """Набор cookie авторизованной сессии в формате Puppeteer (как tweetfree-main/cookies.json)"""
+
+    # Поля CookieParam, которые принимает Network.setCookies
+    CDP_FIELDS = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires", "priority")
+
+    def __init__(self, path, cookies):
+        self.path = path
+        self.cookies = cookies
+        self.healthy = True
+        self.reason = ""
+        self.uses = 0
+
+    def auth_expires(self):
+        """Время истечения cookie auth_token; 0 - сессионная, None - cookie нет"""
+        for cookie in self.cookies:
+            if cookie.get("name") == "auth_token":
+                expires = cookie.get("expires", -1)
+                return 0 if cookie.get("session") or expires is None or expires < 0 else expires
+        return None
+
+    def expired(self):
+        expires = self.auth_expires()
+        return expires is None or (expires and expires < time.time())
+
+    def cdp_cookies(self):
+        """Cookie для Network.setCookies: только поддерживаемые поля, без сессионного expires"""
+        result = []
+        for cookie in self.cookies:
+            param = {key: cookie[key] for key in self.CDP_FIELDS if key in cookie}
+            if param.get("expires", 0) < 0:
+                param.pop("expires")
+            if "domain" not in param:
+                param["url"] = "https://twitter.com"
+            result.append(param)
+        return result
+
+    def mark_unhealthy(self, reason):
+        if self.healthy:
+            logger.warning(f"Набор cookie {self.path} отключен: {reason}")
+        self.healthy = False
+        self.reason = reason
+
+
+# Наборы cookie для авторизованных браузеров, выдаются по кругу
+cookie_sets = None
+cookie_sets_index = 0
+cookie_sets_lock = threading.Lock()
+
+
+def load_cookie_sets():
+    """Загружает наборы cookie из файлов, указанных в настройке browser_cookie_files"""
+    sets = []
+    for path in get_settings().get("browser_cookie_files", []):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cookies = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось загрузить cookie из {path}: {e}")
+            continue
+
+        if not cookies:
+            logger.warning(f"Файл cookie {path} пуст, пропускаем")
+            continue
+
+        cookie_set = CookieSet(path, cookies)
+        if cookie_set.expired():
+            cookie_set.mark_unhealthy("нет действующего auth_token")
+        sets.append(cookie_set)
+
+    logger.info(f"Загружено наборов cookie: {len(sets)}")
+    return sets
+
+
+def next_cookie_set():
+    """Следующий по кругу рабочий набор cookie или None для анонимного браузера"""
+    global cookie_sets, cookie_sets_index
+    with cookie_sets_lock:
+        if cookie_sets is None:
+            cookie_sets = load_cookie_sets()
+
+        for _ in range(len(cookie_sets)):
+            cookie_set = cookie_sets[cookie_sets_index % len(cookie_sets)]
+            cookie_sets_index += 1
+            if cookie_set.healthy and cookie_set.expired():
+                cookie_set.mark_unhealthy("истек auth_token")
+            if cookie_set.healthy:
+                cookie_set.uses += 1
+                return cookie_set
+
+        if cookie_sets:
+            logger.warning("Нет рабочих наборов cookie, браузер запускается без авторизации")
+        return None
+
+
+class BrowserPool:
+    """Пул прогретых браузеров, переиспользуемых между веб-проверками.
+
+    Каждый браузер ведет до tabs_per_browser проверок одновременно в разных вкладках.
+    Новая проверка получает вкладку в уже запущенном браузере, а новый браузер
+    запускается, только когда во всех остальных вкладки заняты.
+    """
+
+    def __init__(self, size=2, max_pages=50, max_rss_mb=700, tabs_per_browser=3):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.tabs_per_browser = max(1, tabs_per_browser)
+        self.browsers = []
+        self.starting = 0
+        self.condition = threading.Condition()
+        self.available = threading.BoundedSemaphore(size * self.tabs_per_browser)
+        self.closed = False
+        self.stats = {"created": 0, "reused": 0, "recycled": 0, "unhealthy": 0}
+
+    @contextlib.contextmanager
+    def session(self):
+        """Выдает вкладку браузера из пула на время одной проверки"""
+        self.available.acquire()
+        tab = None
+        try:
+            tab = self._checkout()
+            yield tab
+        except Exception:
+            # После ошибки состояние браузера неизвестно: новых вкладок в нем не выдаем,
+            # он закроется, когда вернутся остальные
+            if tab is not None:
+                tab.browser.retiring = True
+            raise
+        finally:
+            if tab is not None:
+                self._checkin(tab)
+            self.available.release()
+
+    def _pick_browser(self):
+        """Самый загруженный браузер со свободной вкладкой; вызывается под condition"""
+        candidates = [
+            browser for browser in self.browsers
+            if not browser.retiring and browser.leased < self.tabs_per_browser
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda browser: browser.leased)
+
+    def _checkout(self):
+        while True:
+            with self.condition:
+                browser = self._pick_browser()
+                while browser is None and len(self.browsers) + self.starting >= self.size:
+                    # Все браузеры заняты или еще запускаются - ждем возврата вкладки
+                    self.condition.wait()
+                    browser = self._pick_browser()
+
+                if browser is not None:
+                    # Простаивающий браузер проверяем перед повторным использованием
+                    if browser.leased == 0 and not browser.is_healthy():
+                        logger.warning("Браузер из пула не отвечает, закрываем")
+                        self.stats["unhealthy"] += 1
+                        self.browsers.remove(browser)
+                        browser.close()
+                        continue
+                    self.stats["reused"] += 1
+                    return browser.lease_tab()
+
+                self.starting += 1
+
+            # Браузер запускается вне замка, чтобы не задерживать возврат вкладок
+            try:
+                browser = HTMLSession(cookie_set=next_cookie_set())
+            except Exception:
+                with self.condition:
+                    self.starting -= 1
+                    self.condition.notify_all()
+                raise
+
+            with self.condition:
+                self.starting -= 1
+                self.stats["created"] += 1
+                self.browsers.append(browser)
+                self.condition.notify_all()
+                return browser.lease_tab()
+
+    def _checkin(self, tab):
+        browser = tab.browser
+        tab.finish_load()
+        browser.release_tab(tab)
+
+        with self.condition:
+            if browser.cookie_set and not browser.cookie_set.healthy and not browser.retiring:
+                logger.info("Cookie браузера больше не действуют, пересоздаем")
+                self.stats["recycled"] += 1
+                browser.retiring = True
+
+            if browser.pages_loaded >= self.max_pages and not browser.retiring:
+                logger.info(f"Браузер загрузил {browser.pages_loaded} страниц, пересоздаем")
+                self.stats["recycled"] += 1
+                browser.retiring = True
+
+            if not browser.retiring and browser.leased == 0 and self.max_rss_mb:
+                rss = browser.rss_mb()
+                if rss > self.max_rss_mb:
+                    logger.info(f"Браузер занимает {rss:.0f} МБ (лимит {self.max_rss_mb}), пересоздаем")
+                    self.stats["recycled"] += 1
+                    browser.retiring = True
+
+            close_browser = (browser.retiring or self.closed) and browser.leased == 0
+            if close_browser and browser in self.browsers:
+                self.browsers.remove(browser)
+            self.condition.notify_all()
+
+        if close_browser:
+            browser.close()
+
+    def busy_tabs(self):
+        """Число вкладок, занятых проверками"""
+        with self.condition:
+            return sum(browser.leased for browser in self.browsers)
+
+    def warm_up(self):
+        """Заранее запускает браузеры до размера пула"""
+        while True:
+            with self.condition:
+                if self.closed or len(self.browsers) + self.starting >= self.size:
+                    break
+                self.starting += 1
+
+            try:
+                browser = HTMLSession(cookie_set=next_cookie_set())
+            except Exception as e:
+                logger.error(f"Не удалось прогреть пул браузеров: {e}")
+                with self.condition:
+                    self.starting -= 1
+                    self.condition.notify_all()
+                break
+
+            with self.condition:
+                self.starting -= 1
+                self.stats["created"] += 1
+                self.browsers.append(browser)
+                self.condition.notify_all()
+
+        logger.info(f"Пул браузеров прогрет: {len(self.browsers)} из {self.size}")
+
+    def close(self):
+        """Закрывает простаивающие браузеры; занятые закроются при возврате вкладок"""
+        with self.condition:
+            self.closed = True
+            idle = [browser for browser in self.browsers if browser.leased == 0]
+            for browser in idle:
+                self.browsers.remove(browser)
+        for browser in idle:
+            browser.close()
+
+
+# Пул браузеров создается при первой веб-проверке
+browser_pool = None
+browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Возвращает общий пул браузеров"""
+    global browser_pool
+    with browser_pool_lock:
+        if browser_pool is None:
+            settings = get_settings()
+            browser_pool = BrowserPool(
+                size=settings.get("browser_pool_size", 2),
+                max_pages=settings.get("browser_max_pages", 50),
+                max_rss_mb=settings.get("browser_max_rss_mb", 700),
+                tabs_per_browser=settings.get("browser_tabs_per_instance", 3)
+            )
+        return browser_pool
+
+
+def close_browser_pool():
+    """Закрывает пул браузеров"""
+    global browser_pool
+    with browser_pool_lock:
+        if browser_pool is not None:
+            browser_pool.close()
+            browser_pool = None
+
+
+# Блокировка файлов данных: проверки выполняются и из рабочих потоков
+json_lock = threading.RLock()
 
 
 def load_json(path, default):
     try:
-        with open(path, encoding="utf-8") as f:
+        with json_lock, open(path, encoding="utf-8") as f:
             return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
         return default
@@ -229,15 +1091,69 @@ def init_accounts():
 
 
 def save_json(path, data):
+    """Сохраняет JSON через временный файл: сбой во время записи не портит старую версию.
+
+    Имя временного файла уникально, поэтому одновременные записи из разных процессов
+    не смешиваются в одном файле.
+    """
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with json_lock:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                            prefix=os.path.basename(path) + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+                raise
+        return True
     except Exception as e:
         logger.error(f"Ошибка при сохранении файла {path}: {e}")
+        return False
+
+
+def save_api_limits(twitter_api):
+    """Сохраняет состояние лимитов API; процесс-шард передает его координатору"""
+    if shard_events is not None:
+        shard_events.put(("api_limits", twitter_api))
+        return
+    with json_lock:
+        limits = load_json(API_LIMITS_FILE, {})
+        limits["twitter_api"] = twitter_api
+        save_json(API_LIMITS_FILE, limits)
 
 
 def save_accounts(accounts_data):
-    save_json(ACCOUNTS_FILE, accounts_data)
+    return save_json(ACCOUNTS_FILE, accounts_data)
+
+
+def accounts_file_version():
+    """Версия файла аккаунтов: save_json заменяет файл целиком, поэтому меняется и inode"""
+    try:
+        stat = os.stat(ACCOUNTS_FILE)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+@contextlib.contextmanager
+def accounts_file_lock():
+    """Блокировка файла аккаунтов между процессами и узлами на время чтения-слияния-записи.
+
+    Блокируется отдельный файл рядом с accounts.json: сам файл заменяется через os.replace,
+    и блокировка на нем потерялась бы вместе со старой версией.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(ACCOUNTS_FILE + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 def get_cache():
@@ -261,6 +1177,11 @@ def get_cache():
 
 
 def update_cache(category, key, data, force=False):
+    with json_lock:
+        _update_cache(category, key, data, force)
+
+
+def _update_cache(category, key, data, force=False):
     cache = get_cache()
 
     if category not in cache:
@@ -320,6 +1241,11 @@ def get_from_cache(category, key, max_age=300):
 
 
 def delete_from_cache(category=None, key=None):
+    with json_lock:
+        _delete_from_cache(category, key)
+
+
+def _delete_from_cache(category=None, key=None):
     cache = get_cache()
 
     if category is None:
@@ -349,7 +1275,79 @@ def get_settings():
         "api_request_limit": 20,
         "nitter_instances": NITTER_INSTANCES,
         "health_check_interval": 3600,
-        "last_health_check": 0
+        "last_health_check": 0,
+        "timeline_fingerprint": True,
+        "fingerprint_items": 5,
+        "conditional_requests": False,
+        "nitter_streaming": False,
+        "nitter_stream_items": 5,
+        "parse_workers": 0,
+        "parse_batch_size": 8,
+        "parse_batch_delay": 0.05,
+        "parse_timeout": 30,
+        "validators_flush_interval": 30,
+        "browser_pool_size": 2,
+        "browser_max_pages": 50,
+        "browser_max_rss_mb": 700,
+        "browser_tabs_per_instance": 3,
+        "chromedriver_path": "",
+        "browser_block_resources": True,
+        "web_metrics_control_rate": 0.1,
+        "web_ready_timeout": 10,
+        "web_capture_json": True,
+        "web_login_wall_backoff": 1800,
+        "dead_account_backoff": 21600,
+        "browser_cookie_files": [],
+        "schedule_poll_interval": 30,
+        "accounts_flush_delay": 5,
+        "adaptive_intervals": True,
+        "target_latency": 300,
+        "adaptive_min_interval": 60,
+        "adaptive_max_interval": 3600,
+        "adaptive_reference_gap": 3600,
+        "adaptive_alpha": 0.3,
+        "activity_model": True,
+        "activity_min_samples": 20,
+        "activity_min_factor": 0.5,
+        "activity_max_factor": 3.0,
+        "burst_mode": True,
+        "burst_window": 1800,
+        "burst_interval": 60,
+        "burst_decay": 600,
+        "burst_max_accounts": 10,
+        "autoscale": True,
+        "autoscale_period": 30,
+        "autoscale_min_workers": 1,
+        "autoscale_max_workers": 20,
+        "autoscale_max_lag": 60,
+        "autoscale_warn_period": 3600,
+        "method_limits": {"web": [1, 6], "nitter": [2, 16], "api": [1, 2]},
+        "race_methods": False,
+        "race_stagger": {"nitter": 0, "web": 1.5},
+        "method_selection": "bandit",
+        "method_costs": {"nitter": 1.0, "web": 10.0},
+        "bandit_decay": 0.98,
+        "mirror_lag_grace": 120,
+        "negative_cache": True,
+        "negative_after_failures": 5,
+        "negative_base_backoff": 1800,
+        "negative_max_backoff": 86400,
+        "negative_probe_methods": ["nitter"],
+        "negative_widen_after": 3,
+        "warm_start": True,
+        "warm_start_ramp": 120,
+        "accounts_journal": True,
+        "journal_fsync": True,
+        "shard_count": 0,
+        "shard_vnodes": 100,
+        "coordination": {
+            "enabled": False,
+            "backend": "sqlite",
+            "sqlite_path": "data/leases.db",
+            "redis_url": "redis://localhost:6379/0",
+            "lease_ttl": 120,
+            "heartbeat_interval": 30
+        }
     })
 
     if "api_request_limit" not in settings or not isinstance(settings["api_request_limit"], int):
@@ -487,13 +1485,11 @@ class TwitterClient:
         self.rate_limited = True
         self.rate_limit_reset = reset_time
 
-        limits = load_json(API_LIMITS_FILE, {})
-        limits["twitter_api"] = {
+        save_api_limits({
             "rate_limited": True,
             "reset_time": reset_time,
             "updated_at": int(time.time())
-        }
-        save_json(API_LIMITS_FILE, limits)
+        })
 
     def get_user_by_username(self, username):
         if not self.bearer_token or not self.check_rate_limit():
@@ -753,6 +1749,369 @@ class TwitterClient:
             return user_id, None, None
 
 
+# Ссылки на твиты в разметке Nitter: <a class="tweet-link" href="/user/status/123#m">
+TWEET_LINK_RE = re.compile(rb'class="tweet-link"\s+href="([^"]+)"')
+
+# Статистика пропусков разбора по отпечатку ленты
+fingerprint_stats = {"checks": 0, "skipped": 0}
+
+# Статистика условных запросов по инстансам: {instance: {"requests", "not_modified", "bytes_saved"}}
+conditional_stats = {}
+
+# Статистика потоковой загрузки лент
+streaming_stats = {"fetches": 0, "truncated": 0, "bytes_read": 0}
+
+
+class TimelineItemCounter(HTMLParser):
+    """Инкрементальный счетчик элементов .timeline-item в потоке HTML"""
+
+    def __init__(self):
+        super().__init__()
+        self.items = 0
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            if name == "class" and value and "timeline-item" in value.split():
+                self.items += 1
+                break
+
+
+def timeline_fingerprint(content, items=5):
+    """Отпечаток ленты по первым ссылкам на твиты, без построения DOM"""
+    hrefs = []
+    for match in TWEET_LINK_RE.finditer(content):
+        hrefs.append(match.group(1))
+        if len(hrefs) >= items:
+            break
+
+    if not hrefs:
+        return None
+
+    return hashlib.sha1(b"\n".join(hrefs)).hexdigest()
+
+
+def parse_nitter_timeline(html, username, last_known_id=None, max_items=None):
+    """Разбирает страницу Nitter, возвращает (число элементов, ID твита, данные твита)"""
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Поиск всех твитов
+    tweet_divs = soup.select('.timeline-item')
+    if max_items:
+        # Последний элемент оборванной ленты может быть неполным
+        tweet_divs = tweet_divs[:max_items]
+
+    newest_tweet_id = None
+    newest_tweet_data = None
+    newest_timestamp = None
+
+    # Проходим по всем найденным твитам
+    for tweet_div in tweet_divs:
+        # Проверяем на закрепленный твит
+        is_pinned = bool(tweet_div.select_one('.pinned'))
+
+        # Проверяем на ретвит
+        is_retweet = bool(tweet_div.select_one('.retweet-header'))
+
+        # Пропускаем закрепленные твиты и ретвиты если есть последний известный ID
+        if last_known_id and (is_pinned or is_retweet):
+            continue
+
+        # Извлекаем дату твита
+        tweet_date = tweet_div.select_one('.tweet-date a')
+        if not tweet_date or not tweet_date.get('title'):
+            continue
+
+        # Формат даты в Nitter: "Mar 28, 2025 · 10:50 PM UTC"
+        date_str = tweet_date.get('title')
+        display_date = date_str
+
+        try:
+            # Пробуем разные форматы дат
+            date_formats = [
+                '%b %d, %Y · %I:%M %p UTC',  # Mar 28, 2025 · 10:50 PM UTC
+                '%d %b %Y · %H:%M:%S UTC',  # 28 Mar 2025 · 22:50:00 UTC
+                '%B %d, %Y · %I:%M %p UTC',  # March 28, 2025 · 10:50 PM UTC
+                '%Y-%m-%d %H:%M:%S'  # 2025-03-28 22:50:09
+            ]
+
+            tweet_datetime = None
+            for fmt in date_formats:
+                try:
+                    tweet_datetime = datetime.strptime(date_str, fmt)
+                    break
+                except:
+                    continue
+
+            if not tweet_datetime:
+                # Если не удалось распознать дату, пропускаем твит
+                continue
+
+            tweet_timestamp = tweet_datetime.timestamp()
+        except Exception as e:
+            continue
+
+        # Ссылка на твит и извлечение ID
+        tweet_link = tweet_div.select_one('.tweet-link')
+        if not tweet_link or not tweet_link.get('href'):
+            continue
+
+        # Путь к твиту типа /username/status/12345678
+        href = tweet_link.get('href')
+        # Извлекаем ID
+        match = re.search(r'/status/(\d+)', href)
+        if not match:
+            continue
+
+        tweet_id = match.group(1)
+
+        # Если передан последний известный ID, проверяем, новее ли текущий
+        if last_known_id:
+            try:
+                if int(tweet_id) <= int(last_known_id):
+                    logger.info(
+                        f"Nitter: твит {tweet_id} не новее последнего известного {last_known_id}")
+                    continue  # Пропускаем этот твит, ищем более новые
+            except (ValueError, TypeError):
+                # При ошибке сравнения проверяем по времени
+                pass
+
+        # Проверяем, является ли этот твит новее найденного ранее
+        if newest_timestamp is None or tweet_timestamp > newest_timestamp:
+            newest_timestamp = tweet_timestamp
+            newest_tweet_id = tweet_id
+
+            # Текст твита
+            tweet_content = tweet_div.select_one('.tweet-content')
+            tweet_text = tweet_content.get_text() if tweet_content else "[Текст недоступен]"
+
+            # URL твита
+            tweet_url = f"https://twitter.com/{username}/status/{tweet_id}"
+
+            # Проверяем наличие медиа
+            has_images = bool(tweet_div.select('.attachments .attachment-image'))
+            has_video = bool(tweet_div.select('.attachments .attachment-video'))
+
+            # Получаем метрики, если доступны
+            stats = tweet_div.select('.tweet-stats .icon-container')
+            likes = 0
+            retweets = 0
+
+            for stat in stats:
+                stat_text = stat.get_text(strip=True)
+                if "retweet" in stat.get('class', []):
+                    try:
+                        retweets = int(stat_text)
+                    except:
+                        pass
+                elif "heart" in stat.get('class', []):
+                    try:
+                        likes = int(stat_text)
+                    except:
+                        pass
+
+            # Собираем медиа ссылки
+            media = []
+            if has_images:
+                for img in tweet_div.select('.attachments .attachment-image img'):
+                    if img.get('src'):
+                        media.append({
+                            "type": "photo",
+                            "url": img['src']
+                        })
+
+            if has_video:
+                for video in tweet_div.select('.attachments .attachment-video source'):
+                    if video.get('src'):
+                        media.append({
+                            "type": "video",
+                            "url": video['src']
+                        })
+
+            # Данные о твите
+            newest_tweet_data = {
+                "text": tweet_text,
+                "url": tweet_url,
+                "is_pinned": is_pinned,
+                "is_retweet": is_retweet,
+                "created_at": str(tweet_datetime) if tweet_datetime else "",
+                "formatted_date": display_date,
+                "timestamp": tweet_timestamp,
+                "has_media": has_images or has_video,
+                "likes": likes,
+                "retweets": retweets,
+                "media": media if (has_images or has_video) else []
+            }
+
+            logger.info(f"Найден твит от {display_date}, ID: {tweet_id}")
+
+    return len(tweet_divs), newest_tweet_id, newest_tweet_data
+
+
+def parse_nitter_batch(pages):
+    """Разбирает пачку страниц Nitter в процессе-обработчике"""
+    results = []
+    for html, username, last_known_id, max_items in pages:
+        try:
+            results.append(parse_nitter_timeline(html, username, last_known_id, max_items))
+        except Exception as e:
+            logger.error(f"Ошибка разбора страницы Nitter для @{username}: {e}")
+            results.append((0, None, None))
+    return results
+
+
+class ParseStage:
+    """Пул процессов для разбора HTML с группировкой страниц в пачки"""
+
+    def __init__(self, workers=2, batch_size=8, batch_delay=0.05):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.queue = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name="parse-stage", daemon=True)
+        self.thread.start()
+
+    def submit(self, html, username, last_known_id=None, max_items=None):
+        """Ставит страницу в очередь на разбор, возвращает concurrent.futures.Future.
+
+        После shutdown новые страницы не принимаются: RuntimeError.
+        """
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Пул разбора HTML остановлен")
+            self.queue.put(((bytes(html) if not isinstance(html, str) else html,
+                             username, last_known_id, max_items), future))
+        return future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            # Добираем пачку, пока она не заполнится или не выйдет время ожидания
+            batch = [item]
+            deadline = time.monotonic() + self.batch_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        pages = [page for page, _ in batch]
+        futures = [future for _, future in batch]
+
+        try:
+            batch_future = self.executor.submit(parse_nitter_batch, pages)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        def distribute(done):
+            try:
+                results = done.result()
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                return
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+        batch_future.add_done_callback(distribute)
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join(timeout=5)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+        # Страницы, которые не попали в пачку до остановки, не должны ждать вечно
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("Пул разбора HTML остановлен"))
+
+
+# Пул разбора HTML создается при первом обращении, если parse_workers > 0
+parse_stage = None
+parse_stage_lock = threading.Lock()
+
+
+def get_parse_stage():
+    """Возвращает пул разбора HTML или None, если он отключен"""
+    global parse_stage
+
+    settings = get_settings()
+    workers = settings.get("parse_workers", 0)
+    if not workers:
+        return None
+
+    with parse_stage_lock:
+        if parse_stage is None:
+            logger.info(f"Запуск пула разбора HTML: {workers} процессов")
+            parse_stage = ParseStage(
+                workers=workers,
+                batch_size=settings.get("parse_batch_size", 8),
+                batch_delay=settings.get("parse_batch_delay", 0.05)
+            )
+    return parse_stage
+
+
+def close_parse_stage():
+    """Останавливает пул разбора HTML"""
+    global parse_stage
+    with parse_stage_lock:
+        if parse_stage is not None:
+            parse_stage.shutdown()
+            parse_stage = None
+
+
+# Валидаторы условных запросов к Nitter (ETag/Last-Modified) хранятся в памяти: их меняют
+# проверки из нескольких потоков, а файл переписывается не чаще validators_flush_interval
+nitter_validators = None
+validators_dirty = False
+validators_saved_at = 0
+
+
+def load_validators():
+    """Валидаторы всех инстансов; вызывается под json_lock"""
+    global nitter_validators
+    if nitter_validators is None:
+        nitter_validators = load_json(VALIDATORS_FILE, {})
+    return nitter_validators
+
+
+def flush_validators():
+    """Записывает измененные валидаторы в файл"""
+    global validators_dirty, validators_saved_at
+    with json_lock:
+        if validators_dirty and save_json(VALIDATORS_FILE, nitter_validators):
+            validators_dirty = False
+            validators_saved_at = time.time()
+
+
 class NitterScraper:
     def __init__(self):
         self.session = requests.Session()
@@ -811,8 +2170,72 @@ class NitterScraper:
             return False
         return True
 
-    def get_latest_tweet_nitter(self, username, last_known_id=None):
-        """Получает последний твит через Nitter с проверкой инстансов"""
+    def get_validators(self, instance, username):
+        """Возвращает сохраненные ETag/Last-Modified для аккаунта на инстансе"""
+        with json_lock:
+            return load_validators().get(instance, {}).get(username.lower())
+
+    def store_validators(self, instance, username, response, size):
+        """Сохраняет валидаторы кеша из ответа инстанса"""
+        global validators_dirty
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        with json_lock:
+            instance_validators = load_validators().setdefault(instance, {})
+            if not etag and not last_modified:
+                if instance_validators.pop(username.lower(), None) is None:
+                    return
+            else:
+                instance_validators[username.lower()] = {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "size": size
+                }
+            validators_dirty = True
+            if time.time() - validators_saved_at >= get_settings().get("validators_flush_interval", 30):
+                flush_validators()
+
+    def fetch_timeline_streaming(self, url, headers, max_items, timeout=15, cancel=None):
+        """Загружает ленту потоком и обрывает соединение после первых max_items твитов.
+
+        Без max_items лента читается целиком; по сигналу cancel чтение прерывается.
+        """
+        response = self.session.get(url, headers=headers, timeout=timeout, stream=True)
+        try:
+            if response.status_code != 200:
+                return response, b""
+
+            counter = TimelineItemCounter()
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            chunks = []
+            truncated = False
+
+            for chunk in response.iter_content(chunk_size=8192):
+                if cancel is not None and cancel.is_set():
+                    raise CheckCancelled()
+                chunks.append(chunk)
+                if max_items is None:
+                    continue
+                counter.feed(decoder.decode(chunk))
+                # Начало (max_items + 1)-го элемента значит, что первые max_items уже получены
+                if counter.items > max_items:
+                    truncated = True
+                    break
+
+            content = b"".join(chunks)
+            if max_items is not None:
+                streaming_stats["fetches"] += 1
+                streaming_stats["bytes_read"] += len(content)
+                if truncated:
+                    streaming_stats["truncated"] += 1
+            return response, content
+        finally:
+            # Закрытие недочитанного ответа разрывает соединение
+            response.close()
+
+    def get_latest_tweet_nitter(self, username, last_known_id=None, cancel=None):
+        """Получает последний твит через Nitter с проверкой инстансов; cancel прерывает запрос"""
         logger.info(f"Запрос твитов для @{username} через Nitter...")
 
         try:
@@ -836,180 +2259,127 @@ class NitterScraper:
 
             newest_tweet_id = None
             newest_tweet_data = None
-            newest_timestamp = None
+            newest_fingerprint = None
+
+            # Отпечаток и условные запросы работают только в режиме без фильтра по последнему ID
+            use_fingerprint = settings.get("timeline_fingerprint", True) and not last_known_id
+            conditional = settings.get("conditional_requests", False)
+            cached_data = None
+            if not last_known_id and (use_fingerprint or conditional):
+                cached_data = get_from_cache("tweets", f"nitter_{username.lower()}", 21600)
+
+            streaming = settings.get("nitter_streaming", False)
+            stream_items = settings.get("nitter_stream_items", 5)
+
+            if conditional:
+                # Без обхода кеша, иначе сервер не сможет ответить 304
+                headers['Cache-Control'] = None
+                headers['Pragma'] = None
 
             # Пробуем разные инстансы Nitter
             for nitter in nitter_instances[:3]:
+                if cancel is not None and cancel.is_set():
+                    raise CheckCancelled()
                 try:
-                    # Добавляем случайное число для обхода кеширования
-                    cache_buster = f"?r={int(time.time())}"
-                    full_url = f"{nitter}/{username}{cache_buster}"
+                    request_headers = dict(headers)
+                    validators = None
+
+                    if conditional:
+                        full_url = f"{nitter}/{username}"
+                        # Валидаторы отправляем, только если есть с чем сравнить ответ 304
+                        if cached_data and cached_data.get("tweet_id"):
+                            validators = self.get_validators(nitter, username)
+                        if validators:
+                            if validators.get("etag"):
+                                request_headers['If-None-Match'] = validators["etag"]
+                            if validators.get("last_modified"):
+                                request_headers['If-Modified-Since'] = validators["last_modified"]
+                    else:
+                        # Добавляем случайное число для обхода кеширования
+                        cache_buster = f"?r={int(time.time())}"
+                        full_url = f"{nitter}/{username}{cache_buster}"
 
                     logger.info(f"Попытка получения твитов через {nitter}...")
 
-                    nitter_response = self.session.get(full_url, headers=headers, timeout=15)
+                    if streaming or cancel is not None:
+                        # Потоковое чтение можно оборвать, если проверка отменена
+                        nitter_response, content = self.fetch_timeline_streaming(
+                            full_url, request_headers, stream_items if streaming else None, cancel=cancel)
+                    else:
+                        nitter_response = self.session.get(full_url, headers=request_headers, timeout=15)
+                        content = nitter_response.content
+
+                    if conditional:
+                        stats = conditional_stats.setdefault(
+                            nitter, {"requests": 0, "not_modified": 0, "bytes_saved": 0})
+                        stats["requests"] += 1
+
+                        # 304 означает, что лента не изменилась с прошлой проверки
+                        if nitter_response.status_code == 304 and validators:
+                            stats["not_modified"] += 1
+                            stats["bytes_saved"] += validators.get("size", 0)
+                            logger.info(f"Nitter {nitter}: лента @{username} не изменилась (304)")
+                            return cached_data["tweet_id"], cached_data.get("tweet_data")
+
+                        if nitter_response.status_code == 200 and not last_known_id:
+                            self.store_validators(nitter, username, nitter_response, len(content))
 
                     if nitter_response.status_code != 200:
                         logger.warning(f"Nitter {nitter} вернул код {nitter_response.status_code}")
                         self.report_nitter_failure(nitter)
                         continue
 
-                    soup = BeautifulSoup(nitter_response.text, 'html.parser')
-
-                    # Поиск всех твитов
-                    tweet_divs = soup.select('.timeline-item')
-
-                    if not tweet_divs:
+                    # Если первые твиты ленты не изменились, разбор HTML не нужен
+                    fingerprint = None
+                    if use_fingerprint:
+                        fingerprint = timeline_fingerprint(
+                            content, settings.get("fingerprint_items", 5))
+                        fingerprint_stats["checks"] += 1
+
+                        if (fingerprint and cached_data and cached_data.get("tweet_id")
+                                and cached_data.get("fingerprint") == fingerprint):
+                            fingerprint_stats["skipped"] += 1
+                            logger.info(f"Лента @{username} на {nitter} не изменилась, пропускаем разбор")
+                            return cached_data["tweet_id"], cached_data.get("tweet_data")
+
+                    # Разбор страницы: в пуле процессов, если он включен, иначе в текущем потоке
+                    stage = get_parse_stage()
+                    parsed = None
+                    if stage:
+                        try:
+                            parsed = stage.submit(
+                                content, username, last_known_id, stream_items if streaming else None
+                            ).result(timeout=settings.get("parse_timeout", 30))
+                        except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError,
+                                RuntimeError) as e:
+                            # Пул завис, уже остановлен или отменил пачку при остановке - разбираем страницу здесь
+                            logger.warning(f"Пул разбора HTML не ответил для @{username} ({type(e).__name__}), "
+                                           f"разбираем на месте")
+                    if parsed is None:
+                        html = (content.decode("utf-8", errors="replace")
+                                if streaming or cancel is not None else nitter_response.text)
+                        parsed = parse_nitter_timeline(
+                            html, username, last_known_id, stream_items if streaming else None)
+                    item_count, tweet_id, tweet_data = parsed
+
+                    if not item_count:
                         logger.warning(f"Не найдены твиты на {nitter} для @{username}")
                         self.report_nitter_failure(nitter)
                         continue
 
-                    logger.info(f"Найдено {len(tweet_divs)} твитов на {nitter}")
-
-                    # Проходим по всем найденным твитам
-                    for tweet_div in tweet_divs:
-                        # Проверяем на закрепленный твит
-                        is_pinned = bool(tweet_div.select_one('.pinned'))
-
-                        # Проверяем на ретвит
-                        is_retweet = bool(tweet_div.select_one('.retweet-header'))
-
-                        # Пропускаем закрепленные твиты и ретвиты если есть последний известный ID
-                        if last_known_id and (is_pinned or is_retweet):
-                            continue
+                    logger.info(f"Найдено {item_count} твитов на {nitter}")
 
-                        # Извлекаем дату твита
-                        tweet_date = tweet_div.select_one('.tweet-date a')
-                        if not tweet_date or not tweet_date.get('title'):
-                            continue
-
-                        # Формат даты в Nitter: "Mar 28, 2025 · 10:50 PM UTC"
-                        date_str = tweet_date.get('title')
-                        display_date = date_str
-
-                        try:
-                            # Пробуем разные форматы дат
-                            date_formats = [
-                                '%b %d, %Y · %I:%M %p UTC',  # Mar 28, 2025 · 10:50 PM UTC
-                                '%d %b %Y · %H:%M:%S UTC',  # 28 Mar 2025 · 22:50:00 UTC
-                                '%B %d, %Y · %I:%M %p UTC',  # March 28, 2025 · 10:50 PM UTC
-                                '%Y-%m-%d %H:%M:%S'  # 2025-03-28 22:50:09
-                            ]
-
-                            tweet_datetime = None
-                            for fmt in date_formats:
-                                try:
-                                    tweet_datetime = datetime.strptime(date_str, fmt)
-                                    break
-                                except:
-                                    continue
-
-                            if not tweet_datetime:
-                                # Если не удалось распознать дату, пропускаем твит
-                                continue
-
-                            tweet_timestamp = tweet_datetime.timestamp()
-                        except Exception as e:
-                            continue
-
-                        # Ссылка на твит и извлечение ID
-                        tweet_link = tweet_div.select_one('.tweet-link')
-                        if not tweet_link or not tweet_link.get('href'):
-                            continue
-
-                        # Путь к твиту типа /username/status/12345678
-                        href = tweet_link.get('href')
-                        # Извлекаем ID
-                        match = re.search(r'/status/(\d+)', href)
-                        if not match:
-                            continue
-
-                        tweet_id = match.group(1)
-
-                        # Если передан последний известный ID, проверяем, новее ли текущий
-                        if last_known_id:
-                            try:
-                                if int(tweet_id) <= int(last_known_id):
-                                    logger.info(
-                                        f"Nitter: твит {tweet_id} не новее последнего известного {last_known_id}")
-                                    continue  # Пропускаем этот твит, ищем более новые
-                            except (ValueError, TypeError):
-                                # При ошибке сравнения проверяем по времени
-                                pass
-
-                        # Проверяем, является ли этот твит новее найденного ранее
-                        if newest_timestamp is None or tweet_timestamp > newest_timestamp:
-                            newest_timestamp = tweet_timestamp
-                            newest_tweet_id = tweet_id
-
-                            # Текст твита
-                            tweet_content = tweet_div.select_one('.tweet-content')
-                            tweet_text = tweet_content.get_text() if tweet_content else "[Текст недоступен]"
-
-                            # URL твита
-                            tweet_url = f"https://twitter.com/{username}/status/{tweet_id}"
-
-                            # Проверяем наличие медиа
-                            has_images = bool(tweet_div.select('.attachments .attachment-image'))
-                            has_video = bool(tweet_div.select('.attachments .attachment-video'))
-
-                            # Получаем метрики, если доступны
-                            stats = tweet_div.select('.tweet-stats .icon-container')
-                            likes = 0
-                            retweets = 0
-
-                            for stat in stats:
-                                stat_text = stat.get_text(strip=True)
-                                if "retweet" in stat.get('class', []):
-                                    try:
-                                        retweets = int(stat_text)
-                                    except:
-                                        pass
-                                elif "heart" in stat.get('class', []):
-                                    try:
-                                        likes = int(stat_text)
-                                    except:
-                                        pass
-
-                            # Собираем медиа ссылки
-                            media = []
-                            if has_images:
-                                for img in tweet_div.select('.attachments .attachment-image img'):
-                                    if img.get('src'):
-                                        media.append({
-                                            "type": "photo",
-                                            "url": img['src']
-                                        })
-
-                            if has_video:
-                                for video in tweet_div.select('.attachments .attachment-video source'):
-                                    if video.get('src'):
-                                        media.append({
-                                            "type": "video",
-                                            "url": video['src']
-                                        })
-
-                            # Данные о твите
-                            newest_tweet_data = {
-                                "text": tweet_text,
-                                "url": tweet_url,
-                                "is_pinned": is_pinned,
-                                "is_retweet": is_retweet,
-                                "created_at": str(tweet_datetime) if tweet_datetime else "",
-                                "formatted_date": display_date,
-                                "timestamp": tweet_timestamp,
-                                "has_media": has_images or has_video,
-                                "likes": likes,
-                                "retweets": retweets,
-                                "media": media if (has_images or has_video) else []
-                            }
-
-                            logger.info(f"Найден твит от {display_date}, ID: {tweet_id}")
+                    if tweet_id:
+                        newest_tweet_id = tweet_id
+                        newest_tweet_data = tweet_data
 
                     # Если нашли хотя бы один твит, останавливаемся
                     if newest_tweet_id:
+                        newest_fingerprint = fingerprint
                         break
 
+                except CheckCancelled:
+                    raise
                 except Exception as e:
                     logger.error(f"Ошибка при обращении к {nitter}: {e}")
                     self.report_nitter_failure(nitter)
@@ -1023,6 +2393,7 @@ class NitterScraper:
                 update_cache("tweets", f"nitter_{username.lower()}", {
                     "tweet_id": newest_tweet_id,
                     "tweet_data": newest_tweet_data,
+                    "fingerprint": newest_fingerprint,
                     "updated_at": time.time()
                 }, force=True)
 
@@ -1030,6 +2401,8 @@ class NitterScraper:
 
             logger.warning(f"Не удалось найти твиты для @{username} через все доступные серверы Nitter")
 
+        except CheckCancelled:
+            logger.info(f"Проверка @{username} через Nitter отменена")
         except Exception as e:
             logger.error(f"Общая ошибка при получении твитов для @{username} через Nitter: {e}")
             traceback.print_exc()
@@ -1057,8 +2430,8 @@ class WebScraper:
             return False
         return True
 
-    def get_latest_tweet_web(self, username, last_known_id=None):
-        """Простой веб-скрапинг Twitter без авторизации"""
+    def get_latest_tweet_web(self, username, last_known_id=None, cancel=None):
+        """Простой веб-скрапинг Twitter без авторизации; cancel прерывает ожидание страницы"""
         logger.info(f"Запрос твитов для @{username} через веб-скрапинг...")
 
         # Проверяем, нужно ли делать запрос через веб, если есть последний известный ID
@@ -1069,89 +2442,39 @@ class WebScraper:
                 return last_known_id, cached_data.get("tweet_data")
 
         try:
-            with HTMLSession() as session:
+            with get_browser_pool().session() as session:
                 # URL для страницы со свежими твитами
                 url = f"https://twitter.com/{username}?s=20"
 
                 logger.info(f"Загрузка страницы {url} через веб-скрапинг")
-                session.get(url)
-
-                # Собираем данные о твитах с помощью JavaScript
-                tweets_data = session.driver.execute_script(r"""
-                    function extractTweets() {
-                        const tweets = [];
-                        try {
-                            const tweetElements = document.querySelectorAll('article[data-testid="tweet"]');
-                            console.log(`Найдено ${tweetElements.length} твитов на странице`);
-
-                            for (const article of tweetElements) {
-                                try {
-                                    const socialContext = article.querySelector('[data-testid="socialContext"]');
-                                    const isPinned = socialContext && 
-                                        (socialContext.textContent.includes('Pinned') || 
-                                         socialContext.textContent.includes('Закрепленный') ||
-                                         socialContext.textContent.includes('закреплен'));
-
-                                    let tweetId = null;
-                                    const links = article.querySelectorAll('a[href*="/status/"]');
-                                    for (const link of links) {
-                                        const match = link.href.match(/\/status\/(\d+)/);
-                                        if (match && match[1]) {
-                                            tweetId = match[1];
-                                            break;
-                                        }
-                                    }
-
-                                    if (!tweetId) continue;
-
-                                    const textElement = article.querySelector('[data-testid="tweetText"]');
-                                    const tweetText = textElement ? textElement.innerText : '';
-
-                                    let timestamp = '';
-                                    let displayDate = '';
-                                    const timeElement = article.querySelector('time');
-                                    if (timeElement) {
-                                        timestamp = timeElement.getAttribute('datetime');
-                                        displayDate = timeElement.innerText;
-                                    }
-
-                                    const photoElements = article.querySelectorAll('[data-testid="tweetPhoto"]');
-                                    const mediaUrls = [];
-
-                                    for (const photoEl of photoElements) {
-                                        const img = photoEl.querySelector('img');
-                                        if (img && img.src) {
-                                            let imgUrl = img.src;
-                                            imgUrl = imgUrl.replace('&name=small', '&name=large');
-                                            imgUrl = imgUrl.replace('&name=thumb', '&name=large');
-                                            mediaUrls.push({
-                                                type: 'photo',
-                                                url: imgUrl
-                                            });
-                                        }
-                                    }
-
-                                    tweets.push({
-                                        id: tweetId,
-                                        text: tweetText,
-                                        timestamp: timestamp,
-                                        displayDate: displayDate,
-                                        isPinned: isPinned,
-                                        hasMedia: photoElements.length > 0,
-                                        media: mediaUrls
-                                    });
-                                } catch(e) {
-                                    console.error("Ошибка обработки твита:", e);
-                                }
-                            }
-                        } catch(e) {
-                            console.error("Ошибка сбора твитов:", e);
-                        }
-
-                        return tweets;
-                    }
-                    return extractTweets();
-                """)
+                session.get(url, cancel=cancel)
+
+                if session.page_state == "cancelled":
+                    logger.info(f"Веб-проверка @{username} отменена")
+                    return None, None
+
+                # Стена логина в авторизованном браузере значит, что его cookie больше не действуют
+                if session.page_state == "login_wall" and session.browser.cookie_set:
+                    session.browser.cookie_set.mark_unhealthy("стена логина в авторизованной сессии")
+                    return None, None
+
+                # Стена логина или недоступный профиль: сразу возвращаем исход, не разбирая страницу
+                if session.page_state in PAGE_OUTCOMES:
+                    logger.warning(f"Веб-проверка @{username}: {OUTCOME_LABELS[session.page_state]}")
+                    last_check_outcomes[username.lower()] = session.page_state
+                    return None, None
+
+                # Сначала пробуем JSON ленты, перехваченный на сетевом уровне
+                tweets_data = None
+                if get_settings().get("web_capture_json", True):
+                    tweets_data = session.capture_timeline_json()
+                    if tweets_data:
+                        capture_stats["json"] += 1
+
+                # Если JSON не перехвачен, собираем данные о твитах из DOM
+                if not tweets_data:
+                    capture_stats["dom"] += 1
+                    tweets_data = session.execute_script(DOM_TWEETS_SCRIPT)
 
                 logger.info(f"Извлечено {len(tweets_data) if tweets_data else 0} твитов для @{username}")
 
@@ -1197,7 +2520,9 @@ class WebScraper:
                             "formatted_date": selected_tweet.get('displayDate', 'неизвестная дата'),
                             "is_pinned": selected_tweet.get('isPinned', False),
                             "has_media": selected_tweet.get('hasMedia', False),
-                            "media": selected_tweet.get('media', [])
+                            "media": selected_tweet.get('media', []),
+                            "likes": selected_tweet.get('likes', 0),
+                            "retweets": selected_tweet.get('retweets', 0)
                         }
 
                         # Обновляем кеш
@@ -1313,11 +2638,188 @@ async def send_tweet_with_media(app, subs, username, tweet_id, tweet_data):
                 pass
 
 
-async def check_tweet_multi_method(username, account_methods=None):
-    """Проверяет твиты с запасным использованием API только при находжении числом меньшего ID"""
+# Итоги гонки методов: сколько раз метод запускался, выигрывал, проигрывал (закончил без
+# нового твита или позже победителя), был отменен или пропущен, и суммарное время работы
+race_stats = {}
+
+
+def web_method_deferred(username, account):
+    """Веб-метод временно не используется после стены логина или для недоступного профиля"""
+    skip_until = max(web_login_wall_until, account.get("web_skip_until", 0))
+    if skip_until > time.time():
+        logger.info(f"Веб-метод для @{username} отложен до "
+                    f"{datetime.fromtimestamp(skip_until).strftime('%H:%M')}")
+        return True
+    return False
+
+
+async def race_methods(username, methods, account, last_known_id, nitter_scraper, web_scraper, settings):
+    """Запускает методы одновременно и ждет первый твит новее last_known_id.
+
+    Дорогие методы стартуют с задержкой из race_stagger: часто дешевый успевает раньше,
+    и браузер вообще не понадобится. Проигравшие отменяются на уровне ввода-вывода:
+    поток получает сигнал cancel и обрывает чтение ленты Nitter или загрузку страницы.
+    Возвращает результаты завершившихся методов {метод: (tweet_id, tweet_data)} и победителя.
+    """
+    cancel = threading.Event()
+    stagger = settings.get("race_stagger", {"nitter": 0, "web": 1.5})
+    finished = {}
+    skipped = set()
+
+    def method_stats(method):
+        return race_stats.setdefault(
+            method, {"started": 0, "won": 0, "lost": 0, "cancelled": 0, "skipped": 0, "time": 0.0})
+
+    async def run(method):
+        await asyncio.sleep(stagger.get(method, 0))
+        if method == "web" and web_method_deferred(username, account):
+            method_stats(method)["skipped"] += 1
+            skipped.add(method)
+            return method, None, None
+
+        method_stats(method)["started"] += 1
+        started = time.time()
+        try:
+            if method == "nitter":
+                tweet_id, tweet_data = await run_method(
+                    "nitter", nitter_scraper.get_latest_tweet_nitter, username, None, cancel)
+            elif method == "web":
+                tweet_id, tweet_data = await run_method(
+                    "web", web_scraper.get_latest_tweet_web, username, None, cancel)
+            else:
+                tweet_id, tweet_data = None, None
+        except Exception as e:
+            logger.error(f"Ошибка при проверке {username} методом {method}: {e}")
+            tweet_id, tweet_data = None, None
+        finally:
+            method_stats(method)["time"] += time.time() - started
+        return method, tweet_id, tweet_data
+
+    tasks = [asyncio.create_task(run(method)) for method in methods]
+    winner = None
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            method, tweet_id, tweet_data = await next_result
+            finished[method] = (tweet_id, tweet_data)
+            if tweet_id and (not last_known_id or is_newer_tweet_id(tweet_id, last_known_id)):
+                winner = method
+                break
+    finally:
+        cancel.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    for method in methods:
+        if method in skipped:
+            continue
+        if method == winner:
+            method_stats(method)["won"] += 1
+        elif method in finished:
+            method_stats(method)["lost"] += 1
+        else:
+            method_stats(method)["cancelled"] += 1
+
+    if winner:
+        logger.info(f"Гонка методов для @{username}: первым новый твит нашел {winner}")
+    return finished, winner
+
+
+def is_newer_tweet_id(tweet_id, last_known_id):
+    try:
+        return int(tweet_id) > int(last_known_id)
+    except (ValueError, TypeError):
+        return False
+
+
+# Условная стоимость одной попытки метода в секундах: браузерная вкладка намного дороже запроса к Nitter
+DEFAULT_METHOD_COSTS = {"nitter": 1.0, "web": 10.0}
+
+
+def record_method_result(account, method, success, latency, settings):
+    """Учитывает исход попытки метода в статистике аккаунта (апостериорное Beta-распределение)"""
+    stats = account.setdefault("method_stats", {}).setdefault(method, {"ok": 0.0, "fail": 0.0, "latency": 0.0})
+
+    # Старые исходы постепенно забываются, чтобы выбор следовал за сменой доступности методов
+    decay = settings.get("bandit_decay", 0.98)
+    stats["ok"] = round(stats["ok"] * decay + (1 if success else 0), 3)
+    stats["fail"] = round(stats["fail"] * decay + (0 if success else 1), 3)
+    if success:
+        stats["latency"] = round(0.7 * stats["latency"] + 0.3 * latency if stats["latency"] else latency, 2)
+
+
+def method_succeeded(tweet_id, last_known_id):
+    """Успех метода - получена лента, верхний твит которой не старее известного.
+
+    Тот же ID - тоже успех: у редко пишущего аккаунта это обычный ответ рабочего метода.
+    Зеркало, отдающее устаревшую ленту с тем же ID, выявляется позже, по времени нового твита
+    (см. penalize_lagging_methods).
+    """
+    return bool(tweet_id) and not (last_known_id and is_newer_tweet_id(last_known_id, tweet_id))
+
+
+# Начало эпохи ID твитов (snowflake), мс
+TWITTER_EPOCH_MS = 1288834974657
+
+
+def tweet_id_time(tweet_id):
+    """Время публикации твита (unix time) из его ID; None, если ID не распознан"""
+    try:
+        return ((int(tweet_id) >> 22) + TWITTER_EPOCH_MS) / 1000
+    except (ValueError, TypeError):
+        return None
+
+
+def record_unchanged_report(account, method):
+    """Запоминает, когда метод последний раз ответил лентой без нового твита"""
+    account.setdefault("unchanged_reports", {})[method] = int(time.time())
+
+
+def penalize_lagging_methods(username, account, tweet_id, settings):
+    """Штрафует методы, которые после публикации нового твита еще отдавали старую ленту.
+
+    Время публикации берется из ID твита. Если метод ответил "без изменений" позже, чем через
+    mirror_lag_grace после публикации, он отдавал устаревшую ленту (отстающее зеркало Nitter):
+    тот успех засчитывается как неудача.
+    """
+    reports = account.pop("unchanged_reports", None)
+    posted = tweet_id_time(tweet_id)
+    if not reports or posted is None:
+        return
+    grace = settings.get("mirror_lag_grace", 120)
+    for method, reported in reports.items():
+        if reported > posted + grace:
+            logger.info(f"@{username}: метод {method} отдавал устаревшую ленту "
+                        f"({reported - posted:.0f} с после публикации твита)")
+            record_method_result(account, method, False, 0, settings)
+
+
+def select_methods(account, methods, settings):
+    """Упорядочивает методы аккаунта сэмплированием Томпсона: сначала самый дешевый из вероятно успешных.
+
+    Для каждого метода из Beta(ok + 1, fail + 1) берется вероятность успеха, ожидаемая цена
+    успеха - (стоимость + задержка) / вероятность. Случайность сэмплирования сама дает
+    методам с малой статистикой шанс время от времени оказаться первыми.
+    """
+    costs = settings.get("method_costs", DEFAULT_METHOD_COSTS)
+    method_stats = account.get("method_stats", {})
+
+    def expected_cost(method):
+        stats = method_stats.get(method, {})
+        success = random.betavariate(stats.get("ok", 0) + 1, stats.get("fail", 0) + 1)
+        return (costs.get(method, 1.0) + stats.get("latency", 0)) / max(success, 0.001)
+
+    return sorted(methods, key=expected_cost)
+
+
+async def check_tweet_multi_method(username, account_methods=None, account=None):
+    """Проверяет твиты с запасным использованием API только при находжении числом меньшего ID.
+
+    Если передан account, статистика методов копится в нем, а порядок методов выбирается по ней.
+    """
     settings = get_settings()
-    accounts = init_accounts()
-    account = accounts.get(username.lower(), {})
+    if account is None:
+        account = init_accounts().get(username.lower(), {})
     last_known_id = account.get('last_tweet_id')
 
     # Определяем методы для использования (без API изначально)
@@ -1331,6 +2833,13 @@ async def check_tweet_multi_method(username, account_methods=None):
         methods = [m for m in default_methods if m != "api"]
         logger.info(f"Используем основные методы скрапинга: {methods}")
 
+    # Порядок методов по статистике аккаунта; проверка останавливается на первом методе,
+    # вернувшем актуальную ленту, исследование остальных дает сэмплирование Томпсона
+    bandit = settings.get("method_selection", "bandit") == "bandit" and not settings.get("race_methods", False)
+    if bandit and len(methods) > 1:
+        methods = select_methods(account, methods, settings)
+        logger.info(f"Порядок методов для @{username}: {methods}")
+
     twitter_client = TwitterClient(TWITTER_BEARER)
     nitter_scraper = NitterScraper()
     web_scraper = WebScraper()
@@ -1343,8 +2852,28 @@ async def check_tweet_multi_method(username, account_methods=None):
 
     found_newer_tweet = False  # Флаг для более нового твита
     found_numerically_smaller_id = False  # Новый флаг для проверки числом меньшего ID
+    method_ok = False  # Какой-то метод уже вернул актуальную ленту
     max_found_id = None  # Для хранения максимального найденного ID
 
+    # В режиме гонки методы работают одновременно, первый нашедший новый твит побеждает
+    if settings.get("race_methods", False) and len(methods) > 1:
+        finished, winner = await race_methods(
+            username, methods, account, last_known_id, nitter_scraper, web_scraper, settings)
+        for method, (tweet_id, tweet_data) in finished.items():
+            if not tweet_id:
+                continue
+            results[method]["tweet_id"] = tweet_id
+            results[method]["tweet_data"] = tweet_data
+            try:
+                if max_found_id is None or int(tweet_id) > int(max_found_id):
+                    max_found_id = tweet_id
+                if last_known_id and int(tweet_id) < int(last_known_id):
+                    found_numerically_smaller_id = True
+            except (ValueError, TypeError):
+                pass
+        found_newer_tweet = winner is not None
+        methods = []
+
     # Проверяем сначала основные методы (без API)
     for method in methods:
         try:
@@ -1353,8 +2882,18 @@ async def check_tweet_multi_method(username, account_methods=None):
                 logger.info(f"Уже нашли новый твит, пропускаем {method}")
                 break
 
+            # Метод уже ответил актуальной лентой, следующие только повторят ее
+            if bandit and method_ok:
+                logger.info(f"Лента получена, пропускаем {method}")
+                break
+
+            started = time.time()
             if method == "nitter":
-                tweet_id, tweet_data = nitter_scraper.get_latest_tweet_nitter(username, None)
+                # Запрос выполняется в потоке, чтобы не блокировать цикл событий на время загрузки и разбора
+                tweet_id, tweet_data = await run_method(
+                    "nitter", nitter_scraper.get_latest_tweet_nitter, username, None)
+                method_ok = method_succeeded(tweet_id, last_known_id)
+                record_method_result(account, method, method_ok, time.time() - started, settings)
                 if tweet_id:
                     results["nitter"]["tweet_id"] = tweet_id
                     results["nitter"]["tweet_data"] = tweet_data
@@ -1380,13 +2919,24 @@ async def check_tweet_multi_method(username, account_methods=None):
                             else:
                                 # Тот же самый твит
                                 logger.info("Nitter нашел тот же самый твит, что в кеше")
+                                record_unchanged_report(account, method)
                         except (ValueError, TypeError):
                             pass
                     else:
                         found_newer_tweet = True
 
             elif method == "web":
-                tweet_id, tweet_data = web_scraper.get_latest_tweet_web(username, None)
+                # После стены логина или для недоступного профиля веб-метод временно не используем
+                if web_method_deferred(username, account):
+                    continue
+
+                # Браузер из пула занимает поток, а не цикл событий
+                tweet_id, tweet_data = await run_method(
+                    "web", web_scraper.get_latest_tweet_web, username, None)
+                # Стена логина и недоступный профиль - не провал метода, а состояние аккаунта
+                method_ok = method_succeeded(tweet_id, last_known_id)
+                if tweet_id or username.lower() not in last_check_outcomes:
+                    record_method_result(account, method, method_ok, time.time() - started, settings)
                 if tweet_id:
                     results["web"]["tweet_id"] = tweet_id
                     results["web"]["tweet_data"] = tweet_data
@@ -1412,6 +2962,7 @@ async def check_tweet_multi_method(username, account_methods=None):
                             else:
                                 # Тот же самый твит
                                 logger.info("Web нашел тот же самый твит, что в кеше")
+                                record_unchanged_report(account, method)
                         except (ValueError, TypeError):
                             pass
                     else:
@@ -1420,6 +2971,7 @@ async def check_tweet_multi_method(username, account_methods=None):
         except Exception as e:
             logger.error(f"Ошибка при проверке {username} методом {method}: {e}")
             traceback.print_exc()
+            record_method_result(account, method, False, 0, settings)
 
     # ИСПОЛЬЗУЕМ API ТОЛЬКО ЕСЛИ:
     # 1. Найден твит с ID ЧИСЛОМ МЕНЬШЕ текущего в кеше
@@ -1431,7 +2983,8 @@ async def check_tweet_multi_method(username, account_methods=None):
     if use_api:
         logger.info(f"Найден твит с ID ЧИСЛОМ МЕНЬШЕ текущего, запускаем API как запасной метод")
         try:
-            user_id, tweet_id, tweet_data = twitter_client.get_latest_tweet(username, None)
+            user_id, tweet_id, tweet_data = await run_method(
+                "api", twitter_client.get_latest_tweet, username, None)
             if user_id:
                 results["api"]["user_id"] = user_id
             if tweet_id:
@@ -1481,8 +3034,74 @@ async def check_tweet_multi_method(username, account_methods=None):
                 tweet_data = data["tweet_data"]
                 break
 
+    # Новый твит показывает, какие методы до этого отвечали устаревшей лентой
+    if bandit and last_known_id and is_newer_tweet_id(newest_id, last_known_id):
+        penalize_lagging_methods(username, account, newest_id, settings)
+
     return user_id, newest_id, tweet_data, newest_method
 
+
+def record_check_outcome(username, account, outcome):
+    """Сохраняет исход веб-проверки и откладывает дорогой веб-метод"""
+    global web_login_wall_until
+    settings = get_settings()
+    now = int(time.time())
+
+    if outcome == "login_wall":
+        # Стена логина касается всех аккаунтов, а не только этого
+        web_login_wall_until = now + settings.get("web_login_wall_backoff", 1800)
+        logger.warning(f"Стена логина на @{username}, веб-метод приостановлен для всех аккаунтов")
+    elif outcome in DEAD_ACCOUNT_OUTCOMES:
+        account['last_outcome'] = outcome
+        account['last_outcome_at'] = datetime.now().isoformat()
+        account['web_skip_until'] = now + settings.get("dead_account_backoff", 21600)
+        logger.warning(f"@{username}: {OUTCOME_LABELS[outcome]}, веб-метод отложен")
+        if settings.get("negative_cache", True):
+            mark_negative(username, account, outcome, settings, now)
+
+
+# Причины, по которым аккаунт выведен из обычных проверок
+NEGATIVE_LABELS = dict(OUTCOME_LABELS, unreachable="ни один метод не находит твиты")
+
+
+def mark_negative(username, account, reason, settings, now):
+    """Выводит аккаунт из обычных проверок до пробной проверки; каждая неудачная проба удваивает паузу"""
+    negative = account.get("negative")
+    if negative:
+        negative["reason"] = reason
+        negative["probes"] += 1
+    else:
+        negative = account["negative"] = {"reason": reason, "since": now, "probes": 0}
+        logger.warning(f"@{username}: {NEGATIVE_LABELS[reason]}, аккаунт выведен из обычных проверок")
+
+    backoff = settings.get("negative_base_backoff", 1800) * 2 ** negative["probes"]
+    negative["next_probe"] = now + min(backoff, settings.get("negative_max_backoff", 86400))
+
+
+def clear_negative(username, account):
+    """Возвращает аккаунт в обычные проверки после успешной пробы"""
+    negative = account.pop("negative", None)
+    if negative:
+        logger.info(f"Аккаунт @{username} снова доступен (был: {NEGATIVE_LABELS.get(negative['reason'])})")
+
+
+def probe_methods(account, methods, settings):
+    """Методы для пробной проверки аккаунта из негативного кеша.
+
+    Дешевые методы из negative_probe_methods и метод последней успешной проверки: аккаунт,
+    который находился только браузером, иначе не выйдет из кеша. После negative_widen_after
+    неудачных проб аккаунт проверяется всеми своими методами.
+    """
+    available = account.get("scraper_methods") or methods or settings.get("scraper_methods", ["nitter", "web", "api"])
+    if account["negative"]["probes"] >= settings.get("negative_widen_after", 3):
+        return available
+    probe = [m for m in settings.get("negative_probe_methods", ["nitter"]) if m in available]
+    last_method = account.get("check_method")
+    if last_method in available and last_method not in probe:
+        probe.append(last_method)
+    return probe or available
+
+
 async def process_account(app, subs, accounts, username, account, methods):
     """Обрабатывает один аккаунт и отправляет уведомления при новых твитах"""
     try:
@@ -1500,17 +3119,46 @@ async def process_account(app, subs, accounts, username, account, methods):
         logger.info(f"Проверка аккаунта @{username}, последний ID: {last_id}" +
                     (", приватный: да" if is_private else ""))
 
+        # Аккаунт из негативного кеша проверяем дешевыми методами и последним успешным
+        settings = get_settings()
+        negative = account.get("negative") if settings.get("negative_cache", True) else None
+        if negative:
+            methods = probe_methods(account, methods, settings)
+            logger.info(f"Пробная проверка @{username} ({NEGATIVE_LABELS.get(negative['reason'])}), "
+                        f"методы: {methods}")
+
         # Используем мультиметодную проверку с учетом приватности
         user_id, tweet_id, tweet_data, method = await check_tweet_multi_method(
-            username, methods,
+            username, methods, account
         )
 
         # Обновляем ID пользователя, если получили новый
         if user_id and not account.get('user_id'):
             account['user_id'] = user_id
 
-        # Если не нашли твит
-        if not tweet_id:
+        # Веб-проверка могла вернуть типизированный исход вместо твитов
+        outcome = last_check_outcomes.pop(username.lower(), None)
+        if tweet_id and outcome in DEAD_ACCOUNT_OUTCOMES:
+            # Твит найден другим методом: аккаунт жив, страница показала устаревшее состояние
+            logger.info(f"@{username}: веб-метод сообщил \"{OUTCOME_LABELS[outcome]}\", но твит найден, исход не учитываем")
+            outcome = None
+        if outcome:
+            record_check_outcome(username, account, outcome)
+
+        # Если не нашли твит
+        if not tweet_id:
+            # Известное состояние аккаунта - не сбой скрапера, счетчик неудач не трогаем
+            if outcome:
+                return True
+
+            # Неудачная проба продлевает паузу; серия неудач всех методов выводит аккаунт из проверок
+            account['fail_streak'] = account.get('fail_streak', 0) + 1
+            if negative:
+                mark_negative(username, account, negative["reason"], settings, time.time())
+            elif settings.get("negative_cache", True) and \
+                    account['fail_streak'] >= settings.get("negative_after_failures", 5):
+                mark_negative(username, account, "unreachable", settings, time.time())
+
             # Увеличиваем счетчик неудач
             account['fail_count'] = account.get('fail_count', 0) + 1
             total_checks = account.get('check_count', 1)
@@ -1521,6 +3169,14 @@ async def process_account(app, subs, accounts, username, account, methods):
                 account['priority'] = max(0.1, account.get('priority', 1.0) * 0.9)
             return True
 
+        # Аккаунт снова доступен
+        account.pop('fail_streak', None)
+        clear_negative(username, account)
+        if account.get('last_outcome'):
+            logger.info(f"Аккаунт @{username} снова доступен (был: {OUTCOME_LABELS.get(account['last_outcome'])})")
+            account.pop('last_outcome', None)
+            account.pop('web_skip_until', None)
+
         # Сбрасываем счетчик неудач при успехе
         if account.get('fail_count', 0) > 0:
             account['fail_count'] = max(0, account.get('fail_count', 0) - 1)
@@ -1552,19 +3208,23 @@ async def process_account(app, subs, accounts, username, account, methods):
                 account['last_tweet_url'] = tweet_data.get('url', '')
                 account['tweet_data'] = tweet_data
 
+            # Время твита из его ID уточняет частоту публикаций аккаунта
+            observe_tweet(account, tweet_id, get_settings())
+
             if first_check:
                 account['first_check'] = False
                 account['last_tweet_id'] = tweet_id
                 logger.info(f"Аккаунт @{username}: первая проверка, сохранен ID {tweet_id}")
                 return True
             else:
-                # Нашли новый твит
+                # Нашли новый твит; за ним часто следуют другие (треды, события)
                 account['last_tweet_id'] = tweet_id
+                enter_burst(username.lower(), account, get_settings(), time.time())
                 logger.info(f"Аккаунт @{username}: новый твит {tweet_id}, отправляем уведомления")
 
-                # Отправляем уведомления
+                # Передаем твит на отправку уведомлений, не дожидаясь ее
                 if tweet_data:
-                    await send_tweet_with_media(app, subs, username, tweet_id, tweet_data)
+                    await publish_new_tweet(app, subs, username, tweet_id, tweet_data)
                 return True
         else:
             # ID совпадает, нет новых твитов
@@ -1608,8 +3268,9 @@ async def on_startup(app):
         BotCommand("reset", "Сброс данных аккаунта"),
     ])
 
-    # Инициализируем данные
+    # Инициализируем данные и восстанавливаем результаты проверок, не записанные до остановки
     init_accounts()
+    replay_journal()
 
     # Создаем файл кеша, если не существует
     if not os.path.exists(CACHE_FILE):
@@ -1622,6 +3283,14 @@ async def on_startup(app):
     except Exception as e:
         logger.error(f"Ошибка при обновлении Nitter-инстансов: {e}")
 
+    # Определяем chromedriver и прогреваем пул браузеров, если веб-метод включен
+    if "web" in get_settings().get("scraper_methods", ["nitter", "web", "api"]):
+        try:
+            await asyncio.to_thread(resolve_chromedriver)
+            asyncio.create_task(asyncio.to_thread(get_browser_pool().warm_up))
+        except Exception as e:
+            logger.error(f"Не удалось определить chromedriver: {e}")
+
     # Запускаем фоновую задачу проверки твитов
     global background_task
     background_task = asyncio.create_task(background_check(app))
@@ -1642,158 +3311,1344 @@ async def on_shutdown(app):
             logger.error(f"Ошибка при остановке фоновой задачи: {e}")
         logger.info("Фоновая задача остановлена")
 
+    # Останавливаем обработчики проверок и досылаем найденные твиты
+    await stop_pipeline()
+
+    # Останавливаем пул разбора HTML и закрываем браузеры
+    close_parse_stage()
+    close_method_executor()
+    flush_validators()
+    await asyncio.to_thread(close_browser_pool)
+
 
 # Глобальная переменная для фоновой задачи
 background_task = None
 
 
+# Расписание проверок: куча (время следующей проверки, порядковый номер, аккаунт).
+# Запись в куче устарела, если ее время не совпадает с schedule_due[аккаунт]
+schedule_heap = []
+schedule_due = {}
+schedule_counter = itertools.count()
+checks_in_flight = set()
+
+# Цикл расписания спит до schedule_wake_at; событие будит его раньше, если проверка
+# вернула аккаунт в расписание на более раннее время
+schedule_wakeup = asyncio.Event()
+schedule_wake_at = 0
+
+# Изменения аккаунтов после проверок, еще не записанные в файл
+pending_account_updates = {}
+accounts_flush_task = None
+
+
+# Начало отсчета времени в snowflake-ID твитов (мс)
+TWITTER_EPOCH_MS = 1288834974657
+
+
+def tweet_timestamp(tweet_id):
+    """Время публикации твита (unix time) из его snowflake-ID или None для старых ID"""
+    try:
+        tweet_id = int(tweet_id)
+    except (TypeError, ValueError):
+        return None
+    if tweet_id < 10 ** 15:
+        return None
+    return ((tweet_id >> 22) + TWITTER_EPOCH_MS) / 1000
+
+
+# Гистограмма активности: 168 счетчиков по часам недели (UTC), понедельник 00:00 - ячейка 0
+HOURS_PER_WEEK = 168
+ACTIVITY_MAX_TOTAL = 1000
+
+
+def hour_of_week(timestamp):
+    utc = time.gmtime(timestamp)
+    return utc.tm_wday * 24 + utc.tm_hour
+
+
+def record_activity(account, timestamp):
+    """Учитывает твит в гистограмме активности аккаунта по часам недели"""
+    activity = account.get("activity")
+    if not isinstance(activity, list) or len(activity) != HOURS_PER_WEEK:
+        activity = account["activity"] = [0] * HOURS_PER_WEEK
+    activity[hour_of_week(timestamp)] += 1
+
+    # Старые наблюдения постепенно теряют вес, чтобы модель следовала за сменой режима
+    if sum(activity) > ACTIVITY_MAX_TOTAL:
+        account["activity"] = [count // 2 for count in activity]
+
+
+def activity_factor(account, settings, timestamp):
+    """Множитель интервала для часа недели: меньше 1 в активные часы, больше 1 в тихие.
+
+    Счетчик часа сглаживается соседними часами, а сам множитель растет как корень из
+    отношения среднего счетчика к счетчику часа, в пределах activity_min/max_factor.
+    """
+    activity = account.get("activity")
+    if not activity or sum(activity) < settings.get("activity_min_samples", 20):
+        return 1.0
+
+    hour = hour_of_week(timestamp)
+    count = (0.25 * activity[hour - 1] + 0.5 * activity[hour]
+             + 0.25 * activity[(hour + 1) % HOURS_PER_WEEK])
+    mean = sum(activity) / HOURS_PER_WEEK
+    factor = ((mean + 1) / (count + 1)) ** 0.5
+    return min(settings.get("activity_max_factor", 3.0), max(settings.get("activity_min_factor", 0.5), factor))
+
+
+def observe_tweet(account, tweet_id, settings):
+    """Обновляет оценку частоты публикаций аккаунта по новому твиту.
+
+    Хранится экспоненциальное скользящее среднее интервала между твитами (gap) в секундах.
+    """
+    timestamp = tweet_timestamp(tweet_id)
+    if timestamp is None:
+        return
+
+    posting = account.setdefault("posting", {"last_ts": None, "gap": None, "samples": 0})
+    last_ts = posting.get("last_ts")
+    if last_ts and timestamp > last_ts:
+        gap = timestamp - last_ts
+        alpha = settings.get("adaptive_alpha", 0.3)
+        posting["gap"] = gap if posting.get("gap") is None else alpha * gap + (1 - alpha) * posting["gap"]
+        posting["samples"] = posting.get("samples", 0) + 1
+    if not last_ts or timestamp > last_ts:
+        posting["last_ts"] = timestamp
+        record_activity(account, timestamp)
+
+
+def adaptive_interval(account, settings, now):
+    """Интервал опроса по частоте публикаций или None, пока наблюдений мало.
+
+    Аккаунт, публикующий раз в adaptive_reference_gap секунд, опрашивается раз в 2 * target_latency
+    (средняя задержка уведомления - половина интервала). Для остальных интервал масштабируется
+    как корень из отношения интервалов между твитами: так запросы распределяются в пользу
+    активных аккаунтов, но редкие не остаются без проверок.
+    """
+    posting = account.get("posting") or {}
+    if posting.get("samples", 0) < 2 or not posting.get("gap"):
+        return None
+
+    # Долгое молчание тоже говорит о частоте: учитываем его наполовину
+    gap = posting["gap"]
+    if posting.get("last_ts"):
+        gap = max(gap, 0.5 * (now - posting["last_ts"]))
+
+    reference_gap = settings.get("adaptive_reference_gap", 3600)
+    interval = 2 * settings.get("target_latency", 300) * (gap / reference_gap) ** 0.5
+    return min(settings.get("adaptive_max_interval", 3600),
+               max(settings.get("adaptive_min_interval", 60), interval))
+
+
+# Аккаунты в режиме всплеска: ключ -> время окончания окна
+burst_accounts = {}
+
+
+def enter_burst(key, account, settings, now):
+    """Включает ускоренный опрос аккаунта после нового твита, если не превышен общий лимит"""
+    if not settings.get("burst_mode", True):
+        return False
+
+    for other in [other for other, until in burst_accounts.items() if until <= now]:
+        del burst_accounts[other]
+
+    if key not in burst_accounts and len(burst_accounts) >= settings.get("burst_max_accounts", 10):
+        logger.info(f"Лимит аккаунтов во всплеске достигнут, @{account.get('username', key)} без ускорения")
+        return False
+
+    # Новый твит во время всплеска продлевает окно
+    account["burst_started"] = now
+    account["burst_until"] = burst_accounts[key] = now + settings.get("burst_window", 1800)
+    return True
+
+
+def burst_interval(account, settings, interval, now):
+    """Интервал во время всплеска: сразу после твита burst_interval, затем плавно возвращается к обычному"""
+    if account.get("burst_until", 0) <= now:
+        account.pop("burst_until", None)
+        account.pop("burst_started", None)
+        return interval
+
+    fast = settings.get("burst_interval", 60)
+    if fast >= interval:
+        return interval
+    elapsed = now - account.get("burst_started", now)
+    return fast + (interval - fast) * (1 - math.exp(-elapsed / settings.get("burst_decay", 600)))
+
+
+def compute_next_due(account, settings, now):
+    """Время следующей проверки аккаунта (unix time) по его собственному интервалу"""
+    # Аккаунт из негативного кеша ждет своей пробной проверки
+    negative = account.get("negative")
+    if negative and settings.get("negative_cache", True):
+        return negative["next_probe"]
+
+    interval = settings.get("check_interval", DEFAULT_CHECK_INTERVAL)
+
+    # Интервал, выученный по частоте публикаций аккаунта
+    if settings.get("adaptive_intervals", True):
+        learned = adaptive_interval(account, settings, now)
+        if learned:
+            interval = learned
+            account["poll_interval"] = round(learned)
+        else:
+            account.pop("poll_interval", None)
+
+    # Чаще в часы, когда аккаунт обычно пишет, реже в часы молчания
+    if settings.get("activity_model", True):
+        interval *= activity_factor(account, settings, now + interval)
+
+    # Аккаунты с пониженным приоритетом проверяем реже, с повышенным - чаще
+    priority = min(2.0, max(0.5, account.get("priority", 1.0)))
+    interval /= priority
+
+    # После нового твита аккаунт какое-то время опрашивается чаще
+    interval = burst_interval(account, settings, interval, now)
+
+    if settings.get("randomize_intervals", True):
+        interval *= random.uniform(settings.get("min_interval_factor", 0.8),
+                                   settings.get("max_interval_factor", 1.2))
+    return now + interval
+
+
+def schedule_account(key, next_due):
+    """Ставит аккаунт в расписание на время next_due"""
+    schedule_due[key] = next_due
+    heapq.heappush(schedule_heap, (next_due, next(schedule_counter), key))
+    if next_due < schedule_wake_at:
+        schedule_wakeup.set()
+
+
+def pop_due_accounts(now):
+    """Снимает с расписания аккаунты, время проверки которых подошло: пары (аккаунт, срок)"""
+    due = []
+    while schedule_heap and schedule_heap[0][0] <= now:
+        next_due, _, key = heapq.heappop(schedule_heap)
+        if schedule_due.get(key) == next_due:
+            del schedule_due[key]
+            due.append((key, next_due))
+    return due
+
+
+def next_due_time():
+    """Время ближайшей проверки или None, если расписание пусто"""
+    while schedule_heap and schedule_due.get(schedule_heap[0][2]) != schedule_heap[0][0]:
+        heapq.heappop(schedule_heap)
+    return schedule_heap[0][0] if schedule_heap else None
+
+
+def sync_schedule(accounts, now):
+    """Ставит в расписание новые аккаунты и снимает удаленные или отключенные"""
+    for key in list(schedule_due):
+        if key not in accounts or accounts[key].get("scraper_methods") == []:
+            del schedule_due[key]
+
+    for key, account in accounts.items():
+        if key in schedule_due or key in checks_in_flight or account.get("scraper_methods") == []:
+            continue
+        schedule_account(key, account.get("next_due") or now)
+
+
+def last_check_time(account):
+    """Время последней проверки аккаунта (unix time), 0 если проверок не было"""
+    try:
+        return datetime.fromisoformat(account["last_check"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+
+def warm_start_schedule(accounts, settings, now):
+    """Расписание после запуска: сохраненные сроки сохраняются, просроченные аккаунты
+    равномерно распределяются по окну warm_start_ramp, начиная с давно не проверенных"""
+    overdue = []
+    restored = 0
+    for key, account in accounts.items():
+        if account.get("scraper_methods") == []:
+            continue
+        next_due = account.get("next_due")
+        if next_due and next_due > now:
+            schedule_account(key, next_due)
+            restored += 1
+        else:
+            overdue.append(key)
+
+    overdue.sort(key=lambda key: last_check_time(accounts[key]))
+    ramp = settings.get("warm_start_ramp", 120)
+    for index, key in enumerate(overdue):
+        schedule_account(key, now + ramp * index / len(overdue))
+
+    logger.info(f"Теплый старт: {len(overdue)} просроченных аккаунтов за {ramp} с, "
+                f"{restored} по сохраненному расписанию")
+
+
+def account_changes(before, after):
+    """Поля аккаунта, которые изменила проверка, и удаленные поля"""
+    changed = {key: value for key, value in after.items() if key not in before or before[key] != value}
+    removed = [key for key in before if key not in after]
+    return changed, removed
+
+
+# Версия файла аккаунтов, с которой синхронизировано расписание; собственная запись
+# результатов проверок ее не сбивает, а правка командами или другим узлом - сбивает
+accounts_synced_version = None
+
+
+def commit_account(key, changed, removed):
+    """Копит изменения аккаунта до ближайшей записи файла"""
+    update = pending_account_updates.setdefault(key, {"set": {}, "unset": set()})
+    for field, value in changed.items():
+        update["set"][field] = value
+        update["unset"].discard(field)
+    for field in removed:
+        update["set"].pop(field, None)
+        update["unset"].add(field)
+
+
+def flush_account_updates(force=False):
+    """Записывает накопленные изменения поверх свежей версии файла аккаунтов.
+
+    Изменения, сделанные командами во время проверки (методы, сброс, удаление),
+    не затираются: переносятся только поля, которые изменила сама проверка.
+    После записи журнал очищается: все его изменения уже в файле.
+    Возвращает False, если файл записать не удалось.
+    """
+    global accounts_synced_version
+    if not pending_account_updates and not force:
+        return True
+
+    with json_lock, accounts_file_lock():
+        # Файл менялся не только этим процессом - расписанию нужно перечитать его и после записи
+        changed_outside = accounts_file_version() != accounts_synced_version
+        accounts = load_json(ACCOUNTS_FILE, {})
+        for key, update in pending_account_updates.items():
+            account = accounts.get(key)
+            if account is None:
+                # Аккаунт удалили, пока шла проверка
+                continue
+            account.update(update["set"])
+            for field in update["unset"]:
+                account.pop(field, None)
+        if not save_accounts(accounts):
+            return False
+        if not changed_outside:
+            accounts_synced_version = accounts_file_version()
+        pending_account_updates.clear()
+        if os.path.exists(JOURNAL_FILE):
+            open(JOURNAL_FILE, "w").close()
+    return True
+
+
+def append_journal(key, changed, removed, settings):
+    """Дописывает изменения аккаунта в журнал сразу после проверки.
+
+    Файл аккаунтов записывается раз в несколько секунд, а журнал - после каждой проверки,
+    поэтому после сбоя при запуске восстанавливаются все завершенные проверки.
+    """
+    if not settings.get("accounts_journal", True):
+        return
+    line = json.dumps({"key": key, "set": changed, "unset": list(removed)}, ensure_ascii=False)
+    try:
+        with json_lock, open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            if settings.get("journal_fsync", True):
+                os.fsync(f.fileno())
+    except Exception as e:
+        logger.error(f"Ошибка записи журнала аккаунтов: {e}")
+
+
+def record_account_update(key, changed, removed, settings, lease=False):
+    """Сохраняет изменения аккаунта после проверки: в журнал и в очередь записи файла.
+
+    lease - аккаунт проверялся под арендой; она освобождается после записи файла аккаунтов.
+    В процессе-шарде файл аккаунтов не пишется: изменения вместе с арендой передаются
+    координатору, он и освободит ее после записи.
+    """
+    if shard_events is not None:
+        shard_events.put(("account_update", key, changed, list(removed), lease))
+        held_leases.discard(key)
+        return
+    commit_account(key, changed, removed)
+    append_journal(key, changed, removed, settings)
+    if lease and get_lease_backend(settings) is not None:
+        held_leases.add(key)
+        finished_leases.add(key)
+        start_lease_heartbeat()
+    request_accounts_flush(settings)
+
+
+def replay_journal():
+    """Переносит в файл аккаунтов изменения из журнала, которые не успели попасть в него до остановки"""
+    try:
+        with json_lock, open(JOURNAL_FILE, encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return 0
+
+    replayed = 0
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            # Строка, оборванная сбоем во время записи
+            logger.warning("Пропущена поврежденная запись журнала аккаунтов")
+            continue
+        commit_account(entry["key"], entry["set"], entry["unset"])
+        replayed += 1
+
+    if replayed:
+        logger.info(f"Восстановлено изменений аккаунтов из журнала: {replayed}")
+    # Записи уже примененных изменений безопасно применить повторно: поля получают те же значения
+    flush_account_updates(force=True)
+    return replayed
+
+
+def outbox_add(username, tweet_id, subs, tweet_data):
+    """Записывает уведомление в очередь на диске до отправки; False, если твит уже отправлен или ждет отправки"""
+    key = username.lower()
+    with json_lock:
+        outbox = load_json(OUTBOX_FILE, {"pending": {}, "delivered": {}})
+        entry_id = f"{key}:{tweet_id}"
+        delivered = outbox["delivered"].get(key)
+        if entry_id in outbox["pending"] or (delivered and not is_newer_tweet_id(tweet_id, delivered)):
+            logger.info(f"Уведомление о твите {tweet_id} @{username} уже отправлено или в очереди")
+            return False
+        outbox["pending"][entry_id] = {
+            "username": username,
+            "tweet_id": tweet_id,
+            "subs": subs,
+            "tweet_data": tweet_data,
+            "created": time.time()
+        }
+        save_json(OUTBOX_FILE, outbox)
+    return True
+
+
+def outbox_done(username, tweet_id):
+    """Отмечает уведомление отправленным"""
+    key = username.lower()
+    with json_lock:
+        outbox = load_json(OUTBOX_FILE, {"pending": {}, "delivered": {}})
+        outbox["pending"].pop(f"{key}:{tweet_id}", None)
+        delivered = outbox["delivered"].get(key)
+        if not delivered or is_newer_tweet_id(tweet_id, delivered):
+            outbox["delivered"][key] = tweet_id
+        save_json(OUTBOX_FILE, outbox)
+
+
+def resume_outbox():
+    """Ставит в очередь уведомления, которые не были отправлены до остановки"""
+    pending = load_json(OUTBOX_FILE, {"pending": {}, "delivered": {}})["pending"]
+    for entry in sorted(pending.values(), key=lambda entry: entry["created"]):
+        notify_queue.put_nowait((entry["subs"], entry["username"], entry["tweet_id"], entry["tweet_data"]))
+    if pending:
+        logger.info(f"Досылаем уведомлений после перезапуска: {len(pending)}")
+
+
+async def flush_accounts_later(delay):
+    global accounts_flush_task
+    await asyncio.sleep(delay)
+    accounts_flush_task = None
+    # Аренда отдается только после записи результатов: иначе другой узел прочитает старый срок
+    if flush_account_updates():
+        await release_finished_leases()
+
+
+def request_accounts_flush(settings):
+    """Откладывает запись файла аккаунтов, чтобы объединить результаты нескольких проверок"""
+    global accounts_flush_task
+    if accounts_flush_task is None:
+        accounts_flush_task = asyncio.create_task(flush_accounts_later(settings.get("accounts_flush_delay", 5)))
+
+
+class SqliteLeaseBackend:
+    """Аренда аккаунтов в таблице SQLite; файл базы лежит в общем для узлов хранилище"""
+
+    def __init__(self, path, owner):
+        self.owner = owner
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def transaction(self, statement, rows):
+        """Выполняет statement для каждой строки в одной транзакции; ключи, затронутые запросом"""
+        done = []
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for key, row in rows:
+                    if self.db.execute(statement, row).rowcount:
+                        done.append(key)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return done
+
+    def claim(self, keys, ttl):
+        now = time.time()
+        # Чужая аренда перехватывается только после истечения срока
+        return self.transaction(
+            "INSERT INTO leases (key, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE leases.expires < ? OR leases.owner = excluded.owner",
+            [(key, (key, self.owner, now + ttl, now)) for key in keys])
+
+    def renew(self, keys, ttl):
+        now = time.time()
+        return self.transaction(
+            "UPDATE leases SET expires = ? WHERE key = ? AND owner = ? AND expires >= ?",
+            [(key, (now + ttl, key, self.owner, now)) for key in keys])
+
+    def release(self, keys):
+        return self.transaction("DELETE FROM leases WHERE key = ? AND owner = ?",
+                                [(key, (key, self.owner)) for key in keys])
+
+    def close(self):
+        self.db.close()
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """Минимальный клиент протокола Redis (RESP): команды и конвейер команд"""
+
+    def __init__(self, url, timeout=10):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip("/") or 0)
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.reader = self.sock.makefile("rb")
+        if self.password:
+            self.send_commands([("AUTH", self.password)])
+        if self.db:
+            self.send_commands([("SELECT", self.db)])
+
+    def close(self):
+        if self.sock is not None:
+            with contextlib.suppress(OSError):
+                self.sock.close()
+        self.sock = None
+        self.reader = None
+
+    @staticmethod
+    def encode(args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Соединение с Redis закрыто")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            raise RespError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)[:-2]
+            return data.decode("utf-8", errors="replace")
+        if prefix == b"*":
+            count = int(payload)
+            return None if count < 0 else [self.read_reply() for _ in range(count)]
+        raise RespError(f"Неизвестный ответ Redis: {line!r}")
+
+    def send_commands(self, commands):
+        self.sock.sendall(b"".join(self.encode(command) for command in commands))
+        return [self.read_reply() for _ in commands]
+
+    def pipeline(self, commands):
+        """Отправляет команды одним пакетом и возвращает ответы; при обрыве соединения повторяет один раз"""
+        if not commands:
+            return []
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    return self.send_commands(commands)
+                except (OSError, ConnectionError):
+                    self.close()
+                    if attempt:
+                        raise
+
+
+class RedisLeaseBackend:
+    """Аренда аккаунтов в Redis: Lua-скрипты для захвата, продления и освобождения своих ключей"""
+
+    # Захват свободного ключа или продление своего: повторный захват своей аренды тоже успешен
+    CLAIM_SCRIPT = ("local owner = redis.call('get', KEYS[1]) "
+                    "if not owner or owner == ARGV[1] then "
+                    "redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2]) return 1 else return 0 end")
+    RENEW_SCRIPT = ("if redis.call('get', KEYS[1]) == ARGV[1] then "
+                    "return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end")
+    RELEASE_SCRIPT = ("if redis.call('get', KEYS[1]) == ARGV[1] then "
+                      "return redis.call('del', KEYS[1]) else return 0 end")
+
+    def __init__(self, url, owner, prefix="scrapper:lease:"):
+        self.client = RespClient(url)
+        self.owner = owner
+        self.prefix = prefix
+
+    def claim(self, keys, ttl):
+        replies = self.client.pipeline([("EVAL", self.CLAIM_SCRIPT, 1, self.prefix + key, self.owner, int(ttl * 1000))
+                                        for key in keys])
+        return [key for key, reply in zip(keys, replies) if reply == 1]
+
+    def renew(self, keys, ttl):
+        replies = self.client.pipeline([("EVAL", self.RENEW_SCRIPT, 1, self.prefix + key, self.owner, int(ttl * 1000))
+                                        for key in keys])
+        return [key for key, reply in zip(keys, replies) if reply]
+
+    def release(self, keys):
+        replies = self.client.pipeline([("EVAL", self.RELEASE_SCRIPT, 1, self.prefix + key, self.owner)
+                                        for key in keys])
+        return [key for key, reply in zip(keys, replies) if reply]
+
+    def close(self):
+        self.client.close()
+
+
+# Координация нескольких узлов: сервис аренды, ключи в аренде у этого процесса
+# и ключи, которые освобождаются после записи результатов в файл аккаунтов
+lease_backend = None
+lease_owner = None
+held_leases = set()
+finished_leases = set()
+lease_heartbeat_task = None
+
+
+def coordination_settings(settings):
+    config = {"enabled": False, "backend": "sqlite", "sqlite_path": os.path.join(DATA_DIR, "leases.db"),
+              "redis_url": "redis://localhost:6379/0", "lease_ttl": 120, "heartbeat_interval": 30}
+    config.update(settings.get("coordination", {}))
+    return config
+
+
+def get_lease_backend(settings):
+    """Сервис аренды по настройкам coordination; None, если координация выключена"""
+    global lease_backend
+    config = coordination_settings(settings)
+    if not config["enabled"]:
+        return None
+    if lease_backend is None:
+        # Шарды арендуют от имени координатора: он освобождает аренду после записи их результатов
+        owner = lease_owner or f"{socket.gethostname()}:{os.getpid()}"
+        if config["backend"] == "redis":
+            lease_backend = RedisLeaseBackend(config["redis_url"], owner)
+        else:
+            lease_backend = SqliteLeaseBackend(config["sqlite_path"], owner)
+        logger.info(f"Координация узлов: {config['backend']}, владелец аренды {owner}")
+    return lease_backend
+
+
+async def claim_due_accounts(due, accounts, settings, now):
+    """Захватывает аренду подошедших аккаунтов одной пачкой и возвращает захваченные.
+
+    Аккаунт, который уже арендовал другой узел или который тот уже проверил (срок в файле
+    в будущем), возвращается в расписание на срок из файла или на время аренды.
+    """
+    backend = get_lease_backend(settings)
+    if backend is None or not due:
+        return due
+
+    start_lease_heartbeat()
+
+    config = coordination_settings(settings)
+    ttl = config["lease_ttl"]
+    try:
+        claimed = set(await asyncio.to_thread(backend.claim, [key for key, _ in due], ttl))
+    except Exception as e:
+        # Без аренды не проверяем: иначе аккаунты будут опрашиваться несколькими узлами
+        logger.error(f"Сервис координации недоступен: {e}")
+        for key, _ in due:
+            schedule_account(key, now + config["heartbeat_interval"])
+        return []
+
+    # Другой узел мог проверить аккаунт и отдать аренду уже после того, как мы прочитали файл:
+    # срок захваченных аккаунтов берем из свежей версии
+    fresh = load_json(ACCOUNTS_FILE, {}) if claimed else {}
+
+    result = []
+    already_checked = []
+    for key, due_time in due:
+        if key in claimed:
+            if key not in fresh:
+                # Аккаунт удален командой
+                already_checked.append(key)
+                continue
+            accounts[key]["next_due"] = fresh[key].get("next_due")
+        file_due = accounts[key].get("next_due") or 0
+        if key in claimed and file_due <= now:
+            held_leases.add(key)
+            result.append((key, due_time))
+            continue
+        if key in claimed:
+            already_checked.append(key)
+        schedule_account(key, file_due if file_due > now else now + ttl)
+
+    if already_checked:
+        await asyncio.to_thread(backend.release, already_checked)
+    if len(result) < len(due):
+        logger.info(f"Аренда: захвачено {len(result)} из {len(due)}, остальные проверяют другие узлы")
+    return result
+
+
+async def release_finished_leases():
+    """Освобождает аренду аккаунтов, результаты которых уже записаны в файл"""
+    keys = list(finished_leases)
+    if not keys or lease_backend is None:
+        return
+    finished_leases.difference_update(keys)
+    held_leases.difference_update(keys)
+    try:
+        await asyncio.to_thread(lease_backend.release, keys)
+    except Exception as e:
+        # Аренда истечет сама через lease_ttl
+        logger.error(f"Не удалось освободить аренду {len(keys)} аккаунтов: {e}")
+
+
+def start_lease_heartbeat():
+    global lease_heartbeat_task
+    if lease_heartbeat_task is None or lease_heartbeat_task.done():
+        lease_heartbeat_task = asyncio.create_task(lease_heartbeat())
+
+
+async def lease_heartbeat():
+    """Продлевает аренду аккаунтов, которые проверяются или ждут записи результата"""
+    while True:
+        config = coordination_settings(get_settings())
+        await asyncio.sleep(config["heartbeat_interval"])
+        keys = list(held_leases)
+        if not keys or lease_backend is None:
+            continue
+        try:
+            renewed = set(await asyncio.to_thread(lease_backend.renew, keys, config["lease_ttl"]))
+        except Exception as e:
+            logger.error(f"Не удалось продлить аренду: {e}")
+            continue
+        lost = [key for key in keys if key not in renewed]
+        if lost:
+            logger.warning(f"Аренда потеряна для {len(lost)} аккаунтов (истекла до продления)")
+            held_leases.difference_update(lost)
+
+
+class MethodLimiter:
+    """Ограничитель одновременных запросов одного метода с изменяемым лимитом"""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.active = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        return self
+
+    async def __aexit__(self, *args):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    async def resize(self, limit):
+        async with self.condition:
+            self.limit = max(1, limit)
+            self.condition.notify_all()
+
+
+# Лимиты методов: браузер дорогой, Nitter дешевый, у API жесткие квоты
+DEFAULT_METHOD_LIMITS = {"web": [1, 6], "nitter": [2, 16], "api": [1, 2]}
+method_limiters = {}
+
+# Состояние регулятора: число обработчиков, сглаженная задержка начала проверок
+# относительно их срока и время последнего предупреждения админам
+autoscale_state = {"workers": None, "lag": 0.0, "checks": 0, "last_adjust": 0, "last_warning": 0}
+
+
+def method_limit_range(method, settings):
+    """Диапазон лимита метода (минимум, максимум) из настроек"""
+    low, high = settings.get("method_limits", {}).get(method, DEFAULT_METHOD_LIMITS[method])
+    if method == "web":
+        # Веб-проверок не может быть больше, чем вкладок в пуле браузеров
+        high = min(high, settings.get("browser_pool_size", 2) * settings.get("browser_tabs_per_instance", 3))
+    return low, max(low, high)
+
+
+def get_method_limiter(method):
+    """Ограничитель метода; создается с лимитом, равным текущему числу обработчиков"""
+    limiter = method_limiters.get(method)
+    if limiter is None:
+        settings = get_settings()
+        low, high = method_limit_range(method, settings)
+        workers = autoscale_state["workers"] or settings.get("parallel_checks", 3)
+        limiter = method_limiters[method] = MethodLimiter(min(high, max(low, workers)))
+    return limiter
+
+
+# Пул потоков для запросов методов: отдельный от пула asyncio.to_thread, чтобы браузерные
+# проверки не занимали потоки служебных операций (аренда, очередь шардов, закрытие браузеров)
+method_executor = None
+method_executor_size = 0
+
+
+def method_pool_size():
+    """Размер пула потоков методов - сумма их текущих лимитов"""
+    return sum(get_method_limiter(method).limit for method in DEFAULT_METHOD_LIMITS)
+
+
+def get_method_executor():
+    """Пул потоков методов; пересоздается, если лимиты методов изменились.
+
+    Старый пул закрывается без ожидания: начатые в нем запросы дорабатывают сами.
+    """
+    global method_executor, method_executor_size
+    size = method_pool_size()
+    if method_executor is None or size != method_executor_size:
+        if method_executor is not None:
+            method_executor.shutdown(wait=False)
+        method_executor = concurrent.futures.ThreadPoolExecutor(max_workers=size, thread_name_prefix="method")
+        method_executor_size = size
+    return method_executor
+
+
+def close_method_executor():
+    """Останавливает пул потоков методов"""
+    global method_executor, method_executor_size
+    if method_executor is not None:
+        method_executor.shutdown(wait=False)
+        method_executor = None
+        method_executor_size = 0
+
+
+async def run_method(method, func, *args):
+    """Выполняет запрос метода в пуле потоков методов, заняв слот его ограничителя.
+
+    Слот освобождается, когда поток действительно вернулся: отмененная задача (проигравший
+    в гонке) перестает ждать сразу, но запрос в потоке дорабатывает до проверки cancel.
+    """
+    limiter = get_method_limiter(method)
+    await limiter.__aenter__()
+
+    def release(future):
+        if not future.cancelled():
+            # Результат отмененного ожидания никто не заберет
+            future.exception()
+        asyncio.ensure_future(limiter.__aexit__())
+
+    future = asyncio.get_running_loop().run_in_executor(get_method_executor(), func, *args)
+    future.add_done_callback(release)
+    return await asyncio.shield(future)
+
+
+def record_check_lag(lag):
+    """Учитывает, на сколько секунд позже срока началась проверка аккаунта"""
+    autoscale_state["lag"] = 0.8 * autoscale_state["lag"] + 0.2 * max(0.0, lag)
+    autoscale_state["checks"] += 1
+
+
+async def autoscale_workers(app, settings):
+    """Подстраивает число обработчиков и лимиты методов, чтобы проверки успевали к сроку.
+
+    Если проверки стабильно начинаются позже срока больше чем на autoscale_max_lag и в очереди
+    есть ожидающие, обработчиков добавляется; если задержки почти нет и очередь пуста, их
+    становится меньше. Упершись в максимум, регулятор предупреждает админов.
+    """
+    workers = autoscale_state["workers"] or settings.get("parallel_checks", 3)
+    now = time.time()
+    if not settings.get("autoscale", True):
+        autoscale_state["workers"] = settings.get("parallel_checks", 3)
+        return autoscale_state["workers"]
+    if now - autoscale_state["last_adjust"] < settings.get("autoscale_period", 30):
+        autoscale_state["workers"] = workers
+        return workers
+    autoscale_state["last_adjust"] = now
+
+    min_workers = settings.get("autoscale_min_workers", 1)
+    max_workers = settings.get("autoscale_max_workers", 20)
+    max_lag = settings.get("autoscale_max_lag", 60)
+    lag = autoscale_state["lag"]
+    backlog = check_queue.qsize() if check_queue is not None else 0
+
+    if lag > max_lag and backlog > 0:
+        target = min(max_workers, workers + max(1, workers // 4))
+    elif lag < max_lag / 4 and backlog == 0 and autoscale_state["checks"]:
+        target = max(min_workers, workers - 1)
+    else:
+        target = workers
+    target = min(max_workers, max(min_workers, target))
+
+    if target != workers:
+        logger.info(f"Регулятор: обработчиков {workers} -> {target} (задержка {lag:.0f} с, в очереди {backlog})")
+    autoscale_state["workers"] = target
+
+    # Лимиты методов следуют за числом обработчиков в своих пределах
+    for method in DEFAULT_METHOD_LIMITS:
+        low, high = method_limit_range(method, settings)
+        await get_method_limiter(method).resize(min(high, max(low, target)))
+    # Пул потоков методов следует за суммой лимитов
+    get_method_executor()
+
+    # Даже на максимуме не успеваем - сообщаем админам не чаще раза в autoscale_warn_period
+    if target >= max_workers and lag > max_lag and \
+            now - autoscale_state["last_warning"] > settings.get("autoscale_warn_period", 3600):
+        autoscale_state["last_warning"] = now
+        await warn_admins(app, settings,
+                          f"⚠️ Проверки не успевают: задержка {lag:.0f} с, в очереди {backlog}, "
+                          f"обработчиков {target} (максимум). Увеличьте лимиты или интервал проверки.")
+    return target
+
+
+async def warn_admins(app, settings, text):
+    """Отправляет сообщение всем админам"""
+    if app is None:
+        # В процессе-шарде нет доступа к Telegram
+        logger.warning(text)
+        return
+    admin_ids = set(settings.get("admin_ids", []))
+    if ADMIN_ID:
+        admin_ids.add(ADMIN_ID)
+    for admin_id in admin_ids:
+        try:
+            await app.bot.send_message(chat_id=admin_id, text=text)
+        except Exception as e:
+            logger.error(f"Не удалось отправить предупреждение админу {admin_id}: {e}")
+
+
+# Непрерывный конвейер проверки: очередь аккаунтов к проверке, долгоживущие
+# обработчики и отдельная задача отправки уведомлений
+check_queue = None
+notify_queue = None
+notify_task = None
+check_workers = []
+check_workers_stopping = 0
+
+
+async def check_worker(app, worker_id):
+    """Берет аккаунты из очереди по одному: медленная проверка задерживает только свой обработчик"""
+    global check_workers_stopping
+    while True:
+        job = await check_queue.get()
+        try:
+            if job is None:
+                # Сигнал на уменьшение числа обработчиков
+                check_workers_stopping -= 1
+                return
+
+            key = job["key"]
+            account = job["account"]
+            before = copy.deepcopy(account)
+            record_check_lag(time.time() - job["due"])
+            try:
+                await process_account(app, job["subs"], job["accounts"], job["username"],
+                                      account, job["methods"])
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике {worker_id} при проверке @{job['username']}: {e}")
+            finally:
+                # Аккаунт возвращается в расписание со своим интервалом сразу после проверки
+                settings = get_settings()
+                account["next_due"] = compute_next_due(account, settings, time.time())
+                record_account_update(key, *account_changes(before, account), settings, key in held_leases)
+                checks_in_flight.discard(key)
+                schedule_account(key, account["next_due"])
+        finally:
+            check_queue.task_done()
+
+
+async def notify_worker(app):
+    """Отправляет уведомления о новых твитах по мере их обнаружения"""
+    while True:
+        subs, username, tweet_id, tweet_data = await notify_queue.get()
+        try:
+            await send_tweet_with_media(app, subs, username, tweet_id, tweet_data)
+            outbox_done(username, tweet_id)
+        except Exception as e:
+            logger.error(f"Ошибка отправки уведомления о твите {tweet_id} @{username}: {e}")
+        finally:
+            notify_queue.task_done()
+
+
+async def publish_new_tweet(app, subs, username, tweet_id, tweet_data):
+    """Передает новый твит на отправку; без запущенного конвейера отправляет сразу.
+
+    Уведомление сначала записывается на диск: после сбоя оно будет отправлено при запуске,
+    а повторно найденный твит не будет отправлен второй раз. Шард передает твит координатору.
+    """
+    if shard_events is not None:
+        shard_events.put(("new_tweet", username, tweet_id, tweet_data))
+        return
+    if not outbox_add(username, tweet_id, subs, tweet_data):
+        return
+    if notify_queue is not None:
+        await notify_queue.put((subs, username, tweet_id, tweet_data))
+    else:
+        await send_tweet_with_media(app, subs, username, tweet_id, tweet_data)
+        outbox_done(username, tweet_id)
+
+
+def start_pipeline(app, workers):
+    """Запускает очереди, отправку уведомлений и нужное число обработчиков"""
+    global check_queue, notify_queue, notify_task
+    if check_queue is None:
+        check_queue = asyncio.Queue()
+        notify_queue = asyncio.Queue()
+        notify_task = asyncio.create_task(notify_worker(app))
+        if shard_events is None:
+            resume_outbox()
+    resize_check_workers(app, workers)
+
+
+def resize_check_workers(app, workers):
+    """Доводит число работающих обработчиков до workers"""
+    global check_workers_stopping
+    check_workers[:] = [task for task in check_workers if not task.done()]
+    active = len(check_workers) - check_workers_stopping
+    for _ in range(workers - active):
+        check_workers.append(asyncio.create_task(check_worker(app, len(check_workers) + 1)))
+    for _ in range(active - workers):
+        check_workers_stopping += 1
+        check_queue.put_nowait(None)
+
+
+async def stop_pipeline():
+    """Останавливает обработчики и дожидается отправки уже найденных твитов"""
+    global check_queue, notify_queue, notify_task, check_workers_stopping, accounts_flush_task
+    for task in check_workers:
+        task.cancel()
+    await asyncio.gather(*check_workers, return_exceptions=True)
+    check_workers.clear()
+    check_workers_stopping = 0
+
+    if notify_queue is not None:
+        try:
+            await asyncio.wait_for(notify_queue.join(), timeout=15)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не отправлено уведомлений: {notify_queue.qsize()}")
+        notify_task.cancel()
+        await asyncio.gather(notify_task, return_exceptions=True)
+
+    check_queue = None
+    notify_queue = None
+    notify_task = None
+
+    # Записываем результаты последних проверок
+    if accounts_flush_task is not None:
+        accounts_flush_task.cancel()
+        accounts_flush_task = None
+    written = flush_account_updates()
+
+    # Отдаем аренду аккаунтов, в том числе прерванных проверок, другим узлам. Если результаты
+    # записать не удалось, аренда истечет сама: так другой узел не проверит аккаунт по старому сроку
+    global lease_backend, lease_heartbeat_task
+    if lease_heartbeat_task is not None:
+        lease_heartbeat_task.cancel()
+        lease_heartbeat_task = None
+    if written:
+        finished_leases.update(held_leases)
+        await release_finished_leases()
+    if lease_backend is not None:
+        lease_backend.close()
+        lease_backend = None
+
+
+async def wait_schedule(timeout):
+    """Ждет timeout секунд или пока в расписании не появится более ранняя проверка"""
+    global schedule_wake_at
+    schedule_wakeup.clear()
+    schedule_wake_at = time.time() + timeout
+    try:
+        await asyncio.wait_for(schedule_wakeup.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        schedule_wake_at = 0
+
+
+async def refresh_nitter_instances(settings):
+    """Обновляет список Nitter-инстансов, если прошло health_check_interval с прошлой проверки"""
+    if "nitter" not in settings.get("scraper_methods", ["nitter", "web", "api"]):
+        return
+    current_time = int(time.time())
+    last_check = settings.get("last_health_check", 0)
+    health_check_interval = settings.get("health_check_interval", 1800)  # 30 минут
+
+    if current_time - last_check > health_check_interval:
+        logger.info("Обновление списка Nitter-инстансов...")
+        try:
+            await update_nitter_instances()
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении Nitter-инстансов: {e}")
+
+
 async def background_check(app):
-    """Фоновая проверка аккаунтов с улучшенной логикой приоритетов"""
-    global background_task
+    """Фоновая проверка аккаунтов по расписанию: каждый аккаунт проверяется, когда подходит его время"""
+    global background_task, accounts_synced_version
     background_task = asyncio.current_task()
 
-    # При запуске не проверяем сразу, ждем интервал
     settings = get_settings()
-    wait_time = settings.get("check_interval", DEFAULT_CHECK_INTERVAL)
-    logger.info(f"Фоновая задача запущена, проверка через {wait_time} секунд")
-    await asyncio.sleep(wait_time)
+    if shard_identity is None and settings.get("shard_count", 0) > 1:
+        # Проверяют процессы-шарды, здесь только координатор
+        await run_shard_coordinator(app, settings)
+        return
+
+    accounts = None
+    if settings.get("warm_start", True):
+        # Первый проход начинается сразу, расписание восстанавливается из сохраненных сроков
+        accounts_synced_version = accounts_file_version()
+        accounts = shard_accounts(init_accounts())
+        warm_start_schedule(accounts, settings, time.time())
+    else:
+        # При запуске не проверяем сразу, ждем интервал
+        wait_time = settings.get("check_interval", DEFAULT_CHECK_INTERVAL)
+        logger.info(f"Фоновая задача запущена, проверка через {wait_time} секунд")
+        await asyncio.sleep(wait_time)
 
     while True:
         try:
-            # Проверка на отмену задачи
-            if asyncio.current_task().cancelled():
-                logger.info("Фоновая задача отменена")
-                break
-
             settings = get_settings()
             if not settings.get("enabled", True):
                 logger.info("Мониторинг отключен, пропускаем проверку")
                 await asyncio.sleep(settings["check_interval"])
                 continue
 
-            logger.info("Фоновая проверка аккаунтов")
             subs = load_json(SUBSCRIBERS_FILE, [])
-            accounts = init_accounts()
-
-            # Пропускаем проверку, если нет подписчиков или аккаунтов
-            if not subs or not accounts:
-                logger.info("Нет подписчиков или аккаунтов, пропускаем проверку")
+            if not subs:
+                logger.info("Нет подписчиков, пропускаем проверку")
                 await asyncio.sleep(settings["check_interval"])
                 continue
 
             # Получаем настройки
             methods = settings.get("scraper_methods", ["nitter", "web", "api"])
-            parallel_checks = settings.get("parallel_checks", 3)
-            randomize = settings.get("randomize_intervals", True)
-            accounts_updated = False
-
-            # Проверяем, нужно ли обновить инстансы Nitter
-            if "nitter" in methods:
-                current_time = int(time.time())
-                last_check = settings.get("last_health_check", 0)
-                health_check_interval = settings.get("health_check_interval", 1800)  # 30 минут
-
-                if current_time - last_check > health_check_interval:
-                    logger.info("Обновление списка Nitter-инстансов...")
-                    try:
-                        await update_nitter_instances()
-                    except Exception as e:
-                        logger.error(f"Ошибка при обновлении Nitter-инстансов: {e}")
 
-            # Улучшенная сортировка аккаунтов с учетом приоритета и времени
-            now = datetime.now()
-            sorted_accounts = []
+            # Проверяем, нужно ли обновить инстансы Nitter (в шардах это делает координатор)
+            if shard_identity is None:
+                await refresh_nitter_instances(settings)
 
-            for username, account in accounts.items():
-                # Пропускаем аккаунты с отключенными методами
-                if account.get("scraper_methods") == []:
-                    logger.info(f"Пропускаем аккаунт @{username} с пустым списком методов")
-                    continue
+            # Число обработчиков подстраивается под задержку проверок
+            start_pipeline(app, await autoscale_workers(app, settings))
+
+            # Результаты завершенных проверок уже в объектах аккаунтов; файл перечитывается,
+            # только если его изменил кто-то еще (команды, другой узел, координатор шардов)
+            flush_account_updates()
+            now = time.time()
+            version = accounts_file_version()
+            if accounts is None or version != accounts_synced_version:
+                accounts_synced_version = version
+                accounts = shard_accounts(init_accounts())
+                sync_schedule(accounts, now)
+
+            # Из кучи берем только аккаунты, время которых подошло; остальные не трогаем
+            due = pop_due_accounts(now)
+
+            # При нескольких узлах проверяем только аккаунты, аренду которых удалось захватить
+            due = await claim_due_accounts(due, accounts, settings, now)
+            if due:
+                logger.info(f"К проверке: {len(due)}, уже в работе: {len(checks_in_flight)}")
+            for key, due_time in due:
+                account = accounts[key]
+                checks_in_flight.add(key)
+                check_queue.put_nowait({
+                    "key": key,
+                    "due": due_time,
+                    "subs": subs,
+                    "accounts": accounts,
+                    "username": account.get('username', key),
+                    "account": account,
+                    "methods": account.get('scraper_methods', methods)
+                })
+
+            # Спим до ближайшей проверки, но не дольше schedule_poll_interval,
+            # чтобы подхватывать новые аккаунты и изменения настроек
+            poll_interval = settings.get("schedule_poll_interval", 30)
+            next_due = next_due_time()
+            sleep_time = poll_interval if next_due is None else min(poll_interval, max(0.1, next_due - time.time()))
+            await wait_schedule(sleep_time)
+
+        except asyncio.CancelledError:
+            logger.info("Фоновая задача отменена")
+            break
+        except Exception as e:
+            logger.error(f"Ошибка в фоновой проверке: {e}")
+            traceback.print_exc()
+            # Не останавливаем задачу при ошибках
+            await asyncio.sleep(60)
 
-                # Базовый приоритет
-                priority = account.get("priority", 1.0)
 
-                # Увеличиваем приоритет для аккаунтов с высоким процентом неудач
-                fail_count = account.get("fail_count", 0)
-                if fail_count > 0:
-                    priority += min(0.5, fail_count * 0.1)
+class HashRing:
+    """Консистентное хеширование аккаунтов по шардам.
 
-                # Уменьшаем приоритет для недавно проверенных аккаунтов
-                last_check = account.get("last_check", "2000-01-01T00:00:00")
-                try:
-                    last_check_dt = datetime.fromisoformat(last_check)
-                    hours_since_check = (now - last_check_dt).total_seconds() / 3600
+    Каждый шард занимает vnodes точек на кольце md5; аккаунт принадлежит шарду первой точки
+    за его хешем. При изменении числа шардов переезжает около 1/K аккаунтов.
+    """
 
-                    # Если проверяли менее 1 часа назад, уменьшаем приоритет
-                    if hours_since_check < 1:
-                        priority -= 0.5 * (1 - hours_since_check)  # От -0 до -0.5
-                except Exception:
-                    pass
+    def __init__(self, nodes, vnodes=100):
+        self.ring = sorted((self.hash(f"shard-{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self.points = [point for point, _ in self.ring]
 
-                sorted_accounts.append((username, account, priority))
+    @staticmethod
+    def hash(value):
+        return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:16], 16)
 
-            # Сортируем по уменьшению приоритета
-            sorted_accounts.sort(key=lambda x: x[2], reverse=True)
+    def node_for(self, key):
+        index = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+        return self.ring[index][1]
 
-            # Проверяем аккаунты группами для параллельной обработки
-            for i in range(0, len(sorted_accounts), parallel_checks):
-                # Если задача отменена, выходим
-                if asyncio.current_task().cancelled():
-                    logger.info("Фоновая задача отменена")
-                    return
 
-                # Берем очередную группу аккаунтов
-                batch = sorted_accounts[i:i + parallel_checks]
-                tasks = []
+# В процессе-шарде: очередь событий к координатору и (кольцо, номер шарда)
+shard_events = None
+shard_identity = None
 
-                # Создаем задачи для параллельной проверки аккаунтов
-                for username, account, _ in batch:
-                    if asyncio.current_task().cancelled():
-                        break
+# В координаторе: процессы шардов, период проверки их живости и время на остановку
+shard_processes = {}
+SHARD_LIVENESS_INTERVAL = 5
+SHARD_STOP_TIMEOUT = 30
 
-                    display_name = account.get('username', username)
-                    account_methods = account.get('scraper_methods', methods)
-                    tasks.append(
-                        process_account(app, subs, accounts, display_name, account, account_methods))
-
-                # Запускаем все задачи параллельно
-                if tasks:
-                    results = await asyncio.gather(*tasks, return_exceptions=True)
-                    for result in results:
-                        if isinstance(result, Exception):
-                            logger.error(f"Ошибка в параллельной проверке: {result}")
-                        elif result:  # Если был обновлен аккаунт
-                            accounts_updated = True
-
-                # Небольшая задержка между группами
-                await asyncio.sleep(2)
-
-            # Сохраняем обновленные данные
-            if accounts_updated:
-                save_accounts(accounts)
-
-            # Определяем время до следующей проверки
-            if randomize:
-                # Случайное время в пределах диапазона
-                min_factor = settings.get("min_interval_factor", 0.8)
-                max_factor = settings.get("max_interval_factor", 1.2)
-                factor = random.uniform(min_factor, max_factor)
-                wait_time = int(settings["check_interval"] * factor)
-                logger.info(f"Случайное время ожидания: {wait_time} секунд (x{factor:.2f})")
-            else:
-                wait_time = settings["check_interval"]
-                logger.info(f"Следующая проверка через {wait_time} секунд")
 
-            await asyncio.sleep(wait_time)
+def shard_accounts(accounts):
+    """Аккаунты текущего шарда; вне шардированного режима - все"""
+    if shard_identity is None:
+        return accounts
+    ring, shard_id = shard_identity
+    return {key: account for key, account in accounts.items() if ring.node_for(key) == shard_id}
 
-        except asyncio.CancelledError:
-            logger.info("Фоновая задача отменена")
-            break
-        except Exception as e:
-            logger.error(f"Ошибка в фоновой проверке: {e}")
-            traceback.print_exc()
-            # Не останавливаем задачу при ошибках
-            await asyncio.sleep(60)
+
+def shard_process_main(shard_id, shard_count, vnodes, events, stop_event, owner):
+    """Точка входа процесса-шарда: свой цикл событий, свои пулы HTTP и браузеров"""
+    global shard_events, shard_identity, lease_owner, CACHE_FILE, VALIDATORS_FILE
+    shard_events = events
+    lease_owner = owner
+    shard_identity = (HashRing(range(shard_count), vnodes), shard_id)
+
+    # Кеши у каждого шарда свои: файлы не перезаписываются процессами друг у друга
+    CACHE_FILE = os.path.join(DATA_DIR, f"cache.shard{shard_id}.json")
+    VALIDATORS_FILE = os.path.join(DATA_DIR, f"validators.shard{shard_id}.json")
+    logger.info(f"Шард {shard_id + 1}/{shard_count} запущен (pid {os.getpid()})")
+
+    async def run():
+        task = asyncio.create_task(background_check(None))
+        while not task.done() and not stop_event.is_set():
+            await asyncio.sleep(1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await stop_pipeline()
+        close_parse_stage()
+        close_method_executor()
+        flush_validators()
+        await asyncio.to_thread(close_browser_pool)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    logger.info(f"Шард {shard_id + 1}/{shard_count} остановлен")
+
+
+def start_shard_process(context, shard_id, shard_count, vnodes, events, stop_event):
+    # Не демон: шарду нужен собственный пул процессов разбора HTML, а останавливает его stop_event
+    process = context.Process(target=shard_process_main, name=f"shard-{shard_id}",
+                              args=(shard_id, shard_count, vnodes, events, stop_event, lease_owner),
+                              daemon=False)
+    process.start()
+    shard_processes[shard_id] = process
+    return process
+
+
+async def run_shard_coordinator(app, settings):
+    """Координатор шардированного режима.
+
+    Запускает shard_count процессов, каждый проверяет свою часть аккаунтов. Координатор
+    единственный пишет файл аккаунтов и общается с Telegram: шарды присылают ему изменения
+    аккаунтов и новые твиты. Упавший шард перезапускается.
+    """
+    shard_count = settings.get("shard_count", 0)
+    vnodes = settings.get("shard_vnodes", 100)
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    stop_event = context.Event()
+
+    global lease_owner
+    lease_owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    # Очередь уведомлений и досылка неотправленных после перезапуска
+    start_pipeline(app, 0)
+
+    for shard_id in range(shard_count):
+        start_shard_process(context, shard_id, shard_count, vnodes, events, stop_event)
+    logger.info(f"Шардированный режим: {shard_count} процессов проверки")
+
+    next_liveness_check = 0
+    try:
+        while True:
+            await receive_shard_event(app, events, 1.0)
+
+            # Живость шардов и обновление инстансов проверяются по времени, даже если события идут потоком
+            if time.time() >= next_liveness_check:
+                next_liveness_check = time.time() + SHARD_LIVENESS_INTERVAL
+                for shard_id, process in list(shard_processes.items()):
+                    if not process.is_alive():
+                        logger.error(f"Шард {shard_id + 1} завершился с кодом {process.exitcode}, перезапускаем")
+                        start_shard_process(context, shard_id, shard_count, vnodes, events, stop_event)
+                await refresh_nitter_instances(get_settings())
+    finally:
+        stop_event.set()
+
+        # Шард не завершится, пока его данные не вычитаны из очереди, поэтому читаем ее,
+        # пока шарды останавливаются (все одновременно)
+        deadline = time.time() + SHARD_STOP_TIMEOUT
+        while time.time() < deadline and any(process.is_alive() for process in shard_processes.values()):
+            await receive_shard_event(app, events, 0.5)
+        for shard_id, process in shard_processes.items():
+            if process.is_alive():
+                logger.warning(f"Шард {shard_id + 1} не остановился за {SHARD_STOP_TIMEOUT} с, завершаем")
+                process.terminate()
+            process.join(5)
+        shard_processes.clear()
+
+        # События, которые шарды успели прислать перед остановкой
+        while await receive_shard_event(app, events, 0.1):
+            pass
+
+
+async def receive_shard_event(app, events, timeout):
+    """Получает и обрабатывает одно событие шарда; False, если за timeout событий не было"""
+    try:
+        event = await asyncio.to_thread(events.get, True, timeout)
+    except queue.Empty:
+        return False
+
+    kind = event[0]
+    try:
+        if kind == "account_update":
+            _, key, changed, removed, lease = event
+            record_account_update(key, changed, removed, get_settings(), lease)
+        elif kind == "new_tweet":
+            _, username, tweet_id, tweet_data = event
+            await publish_new_tweet(app, load_json(SUBSCRIBERS_FILE, []), username, tweet_id, tweet_data)
+        elif kind == "api_limits":
+            save_api_limits(event[1])
+    except Exception as e:
+        logger.error(f"Ошибка обработки события шарда {kind}: {e}")
+    return True
 
 
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1987,6 +4842,26 @@ async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         account_line += f"\n  ID: {tweet_id}, {success_rate:.0f}%, метод: {method}, проверка: {last_check}"
         account_line += f"\n  🛠 Методы: {methods_info}"
+        if data.get("burst_until", 0) > time.time():
+            account_line += "\n  🔥 Ускоренная проверка после нового твита"
+        if data.get("poll_interval"):
+            gap = data.get("posting", {}).get("gap", 0)
+            account_line += (f"\n  ⏱ Интервал: {data['poll_interval'] // 60} мин"
+                             f" (твит примерно раз в {gap / 3600:.1f} ч)")
+        method_stats = data.get("method_stats")
+        if method_stats:
+            rates = ", ".join(
+                f"{name} {100 * stats['ok'] / max(stats['ok'] + stats['fail'], 0.001):.0f}%"
+                for name, stats in method_stats.items()
+            )
+            account_line += f"\n  🎯 Успешность методов: {rates}"
+        negative = data.get("negative")
+        if negative:
+            next_probe = datetime.fromtimestamp(negative["next_probe"]).strftime("%d.%m %H:%M")
+            account_line += (f"\n  🚫 Не проверяется: {NEGATIVE_LABELS.get(negative['reason'], negative['reason'])}, "
+                             f"проба {next_probe} (неудачных проб: {negative['probes']})")
+        elif data.get("last_outcome"):
+            account_line += f"\n  ⛔ {OUTCOME_LABELS.get(data['last_outcome'], data['last_outcome'])}"
         msg += account_line
 
         if tweet_text:
@@ -2255,6 +5130,87 @@ async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if count > 0:
             stats_message += f"• {method}: {count} аккаунтов\n"
 
+    # Пропуски разбора Nitter по отпечатку ленты
+    fp_checks = fingerprint_stats["checks"]
+    if fp_checks:
+        fp_skipped = fingerprint_stats["skipped"]
+        stats_message += (f"\n**Отпечатки ленты Nitter:**\n• Проверок: {fp_checks}\n"
+                          f"• Пропущено разборов: {fp_skipped} ({100.0 * fp_skipped / fp_checks:.1f}%)\n")
+
+    # Потоковая загрузка лент Nitter
+    if streaming_stats["fetches"]:
+        avg_kb = streaming_stats["bytes_read"] / streaming_stats["fetches"] / 1024
+        stats_message += (f"\n**Потоковая загрузка Nitter:**\n• Загрузок: {streaming_stats['fetches']}, "
+                          f"оборвано досрочно: {streaming_stats['truncated']}\n"
+                          f"• В среднем на загрузку: {avg_kb:.0f} КБ\n")
+
+    # Загрузка страниц веб-методом с блокировкой ресурсов и без нее
+    for mode, title in (("no_blocking", "без блокировки"), ("blocking", "с блокировкой")):
+        with web_metrics_lock:
+            metrics = dict(web_metrics[mode])
+        if metrics["loads"]:
+            stats_message += (f"\n**Веб-метод {title}:**\n• Загрузок: {metrics['loads']}, "
+                              f"в среднем до готовности {metrics['load_time'] / metrics['loads']:.1f} с\n"
+                              f"• Заблокировано запросов: {metrics['blocked']}\n")
+
+    # Источник твитов веб-метода: перехваченный JSON ленты или DOM
+    if capture_stats["json"] or capture_stats["dom"]:
+        stats_message += (f"\n**Источник данных веб-метода:**\n• JSON ленты: {capture_stats['json']}, "
+                          f"DOM: {capture_stats['dom']}\n")
+
+    # Гонка методов
+    if race_stats:
+        stats_message += "\n**Гонка методов:**\n"
+        for method, stats in race_stats.items():
+            avg_time = stats["time"] / stats["started"] if stats["started"] else 0
+            stats_message += (f"• {method}: побед {stats['won']}, проигрышей {stats['lost']}, "
+                              f"отменено {stats['cancelled']}, пропущено {stats['skipped']}, "
+                              f"в среднем {avg_time:.1f} с\n")
+
+    # Регулятор числа обработчиков
+    if autoscale_state["workers"]:
+        limits = ", ".join(f"{method} {limiter.active}/{limiter.limit}" for method, limiter in method_limiters.items())
+        stats_message += (f"\n**Планировщик:**\n• Обработчиков: {autoscale_state['workers']}, "
+                          f"в очереди: {check_queue.qsize() if check_queue is not None else 0}\n"
+                          f"• Задержка начала проверок: {autoscale_state['lag']:.0f} с\n")
+        if limits:
+            stats_message += f"• Методы (занято/лимит): {limits}\n"
+
+    # Координация узлов
+    if lease_backend is not None:
+        stats_message += (f"\n**Координация узлов:**\n• Владелец аренды: {lease_backend.owner}\n"
+                          f"• Аккаунтов в аренде: {len(held_leases)}\n")
+
+    # Процессы-шарды
+    if shard_processes:
+        alive = sum(1 for process in shard_processes.values() if process.is_alive())
+        stats_message += f"\n**Шарды:**\n• Процессов проверки: {alive} из {len(shard_processes)}\n"
+
+    # Пул браузеров для веб-проверок
+    if browser_pool is not None:
+        pool_stats = browser_pool.stats
+        stats_message += (f"\n**Пул браузеров:**\n• Запущено браузеров: {len(browser_pool.browsers)} из {browser_pool.size}, "
+                          f"занято вкладок: {browser_pool.busy_tabs()} из {browser_pool.size * browser_pool.tabs_per_browser}\n"
+                          f"• Запущено: {pool_stats['created']}, повторно использовано: {pool_stats['reused']}\n"
+                          f"• Пересоздано: {pool_stats['recycled']}, не отвечали: {pool_stats['unhealthy']}\n")
+
+    # Наборы cookie авторизованных браузеров
+    if cookie_sets:
+        healthy = sum(1 for cookie_set in cookie_sets if cookie_set.healthy)
+        stats_message += f"\n**Наборы cookie:**\n• Рабочих: {healthy} из {len(cookie_sets)}\n"
+        for cookie_set in cookie_sets:
+            if not cookie_set.healthy:
+                stats_message += f"• {os.path.basename(cookie_set.path)}: {cookie_set.reason}\n"
+
+    # Условные запросы (ETag/Last-Modified) по инстансам
+    if conditional_stats:
+        stats_message += "\n**Условные запросы Nitter:**\n"
+        for instance, stats in conditional_stats.items():
+            not_modified_rate = 100.0 * stats["not_modified"] / max(1, stats["requests"])
+            saved_kb = stats["bytes_saved"] / 1024
+            stats_message += (f"• {instance.replace('https://', '')}: 304 в {not_modified_rate:.1f}% "
+                              f"из {stats['requests']}, сэкономлено {saved_kb:.0f} КБ\n")
+
     # API статистика
     if TWITTER_BEARER:
         api_limits = load_json(API_LIMITS_FILE, {}).get("twitter_api", {})
@@ -2677,7 +5633,79 @@ def main():
             "api_request_limit": 20,
             "nitter_instances": NITTER_INSTANCES,
             "health_check_interval": 1800,  # 30 минут
-            "last_health_check": 0
+            "last_health_check": 0,
+            "timeline_fingerprint": True,
+            "fingerprint_items": 5,
+            "conditional_requests": False,
+            "nitter_streaming": False,
+            "nitter_stream_items": 5,
+            "parse_workers": 0,
+            "parse_batch_size": 8,
+            "parse_batch_delay": 0.05,
+            "parse_timeout": 30,
+            "validators_flush_interval": 30,
+            "browser_pool_size": 2,
+            "browser_max_pages": 50,
+            "browser_max_rss_mb": 700,
+            "browser_tabs_per_instance": 3,
+            "chromedriver_path": "",
+            "browser_block_resources": True,
+            "web_metrics_control_rate": 0.1,
+            "web_ready_timeout": 10,
+            "web_capture_json": True,
+            "web_login_wall_backoff": 1800,
+            "dead_account_backoff": 21600,
+            "browser_cookie_files": [],
+            "schedule_poll_interval": 30,
+            "accounts_flush_delay": 5,
+            "adaptive_intervals": True,
+            "target_latency": 300,
+            "adaptive_min_interval": 60,
+            "adaptive_max_interval": 3600,
+            "adaptive_reference_gap": 3600,
+            "adaptive_alpha": 0.3,
+            "activity_model": True,
+            "activity_min_samples": 20,
+            "activity_min_factor": 0.5,
+            "activity_max_factor": 3.0,
+            "burst_mode": True,
+            "burst_window": 1800,
+            "burst_interval": 60,
+            "burst_decay": 600,
+            "burst_max_accounts": 10,
+            "autoscale": True,
+            "autoscale_period": 30,
+            "autoscale_min_workers": 1,
+            "autoscale_max_workers": 20,
+            "autoscale_max_lag": 60,
+            "autoscale_warn_period": 3600,
+            "method_limits": {"web": [1, 6], "nitter": [2, 16], "api": [1, 2]},
+            "race_methods": False,
+            "race_stagger": {"nitter": 0, "web": 1.5},
+            "method_selection": "bandit",
+            "method_costs": {"nitter": 1.0, "web": 10.0},
+            "bandit_decay": 0.98,
+            "mirror_lag_grace": 120,
+            "negative_cache": True,
+            "negative_after_failures": 5,
+            "negative_base_backoff": 1800,
+            "negative_max_backoff": 86400,
+            "negative_probe_methods": ["nitter"],
+            "negative_widen_after": 3,
+            "warm_start": True,
+            "warm_start_ramp": 120,
+            "accounts_journal": True,
+            "journal_fsync": True,
+            "shard_count": 0,
+            "shard_vnodes": 100,
+            "coordination": {
+                "enabled": False,
+                "backend": "sqlite",
+                "sqlite_path": "data/leases.db",
+                "redis_url": "redis://localhost:6379/0",
+                "lease_ttl": 120,
+                "heartbeat_interval": 30
+            }
         })
     ]:
         if not os.path.exists(path):